@@ -1,11 +1,22 @@
-import os, math
+import os, math, time, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from functools import lru_cache
+from multiprocessing import shared_memory
+import numpy as np
 import pandas as pd
+import openpyxl
 from pyproj import CRS, Transformer, datadir as pyproj_datadir
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
 
+from instrument import StageProfiler, profile_path, trace_memory_requested
+from task_runner import BackgroundTask, TaskCancelled, iter_progress
+from transform_cache import TransformCache
+from workbook_session import (FRAME_CHUNK, csv_numeric, csv_values, fit_row, get_session, is_table_file, iter_table_frames,
+                              sheet_row_count, table_row_count)
+
 # 让打包后的 EXE 能找到 PROJ 数据
 os.environ.setdefault("PROJ_LIB", pyproj_datadir.get_data_dir())
 
@@ -91,31 +102,619 @@ def bd09_to_wgs84(lon, lat):
     glon, glat = bd09_to_gcj02(lon, lat)
     return gcj02_to_wgs84(glon, glat)
 
+# ---------- GCJ-02 / BD-09 数组版（整列一次计算） ----------
+def _out_of_china_np(lon, lat):
+    """返回布尔掩码：True 表示在中国范围外（NaN 也视为范围外，原样返回）"""
+    return ~((lon >= 73.66) & (lon <= 135.05) & (lat >= 3.86) & (lat <= 53.55))
+
+def _transform_lat_np(lon, lat):
+    ret = -100.0 + 2.0*lon + 3.0*lat + 0.2*lat*lat + 0.1*lon*lat + 0.2*np.sqrt(np.abs(lon))
+    ret += (20.0*np.sin(6.0*lon*PI) + 20.0*np.sin(2.0*lon*PI))*2.0/3.0
+    ret += (20.0*np.sin(lat*PI) + 40.0*np.sin(lat/3.0*PI))*2.0/3.0
+    ret += (160.0*np.sin(lat/12.0*PI) + 320.0*np.sin(lat*PI/30.0))*2.0/3.0
+    return ret
+
+def _transform_lon_np(lon, lat):
+    ret = 300.0 + lon + 2.0*lat + 0.1*lon*lon + 0.1*lon*lat + 0.1*np.sqrt(np.abs(lon))
+    ret += (20.0*np.sin(6.0*lon*PI) + 20.0*np.sin(2.0*lon*PI))*2.0/3.0
+    ret += (20.0*np.sin(lon*PI) + 40.0*np.sin(lon/3.0*PI))*2.0/3.0
+    ret += (150.0*np.sin(lon/12.0*PI) + 300.0*np.sin(lon/30.0*PI))*2.0/3.0
+    return ret
+
+def _gcj02_offset_np(lon, lat):
+    """WGS84 → GCJ-02 的偏移量 (dlon, dlat)，不判断是否在中国范围内（偏移网格在边界外也需要光滑延拓）"""
+    dlat = _transform_lat_np(lon - 105.0, lat - 35.0)
+    dlon = _transform_lon_np(lon - 105.0, lat - 35.0)
+    radlat = lat / 180.0 * PI
+    magic = np.sin(radlat)
+    magic = 1 - EE * magic * magic
+    sqrtmagic = np.sqrt(magic)
+    dlat = (dlat * 180.0) / ((A * (1 - EE)) / (magic * sqrtmagic) * PI)
+    dlon = (dlon * 180.0) / (A / sqrtmagic * np.cos(radlat) * PI)
+    return dlon, dlat
+
+def wgs84_to_gcj02_np(lon, lat):
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    dlon, dlat = _gcj02_offset_np(lon, lat)
+    out = _out_of_china_np(lon, lat)
+    return np.where(out, lon, lon + dlon), np.where(out, lat, lat + dlat)
+
+def gcj02_to_bd09_np(lon, lat):
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    z = np.sqrt(lon*lon + lat*lat) + 0.00002 * np.sin(lat * PI)
+    theta = np.arctan2(lat, lon) + 0.000003 * np.cos(lon * PI)
+    return z * np.cos(theta) + 0.0065, z * np.sin(theta) + 0.006
+
+def bd09_to_gcj02_np(lon, lat):
+    x = np.asarray(lon, dtype=np.float64) - 0.0065
+    y = np.asarray(lat, dtype=np.float64) - 0.006
+    z = np.sqrt(x*x + y*y) - 0.00002 * np.sin(y * PI)
+    theta = np.arctan2(y, x) - 0.000003 * np.cos(x * PI)
+    return z * np.cos(theta), z * np.sin(theta)
+
+def wgs84_to_bd09_np(lon, lat):
+    glon, glat = wgs84_to_gcj02_np(lon, lat)
+    return gcj02_to_bd09_np(glon, glat)
+
+def solve_gcj02_inverse(lon, lat, tol=1e-7, max_iter=30):
+    """
+    GCJ-02 → WGS84 整列反解：不动点迭代 w ← w - (wgs84_to_gcj02(w) - g)，
+    每轮只计算尚未收敛的点（残差 < tol 即移出工作集）。
+    返回 (lon, lat, max_err, n_iter)：max_err 为全体点的最大残差（度），n_iter 为实际迭代轮数
+    """
+    glon = np.asarray(lon, dtype=np.float64)
+    glat = np.asarray(lat, dtype=np.float64)
+    shape = glon.shape
+    glon = glon.ravel(); glat = glat.ravel()
+    wlon = glon.copy(); wlat = glat.copy()
+    err = np.zeros(glon.shape)
+    act = np.flatnonzero(~_out_of_china_np(glon, glat))
+    n_iter = 0
+    while act.size and n_iter < max_iter:
+        n_iter += 1
+        clon, clat = wgs84_to_gcj02_np(wlon[act], wlat[act])
+        dlon = clon - glon[act]
+        dlat = clat - glat[act]
+        err[act] = np.maximum(np.abs(dlon), np.abs(dlat))
+        keep = err[act] >= tol
+        act = act[keep]
+        wlon[act] -= dlon[keep]
+        wlat[act] -= dlat[keep]
+    if act.size:  # 达到 max_iter 仍未收敛：按最后一次更新重新计算残差
+        clon, clat = wgs84_to_gcj02_np(wlon[act], wlat[act])
+        err[act] = np.maximum(np.abs(clon - glon[act]), np.abs(clat - glat[act]))
+    max_err = float(err.max()) if err.size else 0.0
+    return wlon.reshape(shape), wlat.reshape(shape), max_err, n_iter
+
+def gcj02_to_wgs84_np(lon, lat, tol=1e-7):
+    wlon, wlat, _, _ = solve_gcj02_inverse(lon, lat, tol=tol)
+    return wlon, wlat
+
+def solve_bd09_inverse(lon, lat, tol=1e-7, max_iter=30):
+    """BD-09 → WGS84 整列反解，返回值同 solve_gcj02_inverse（残差按 GCJ-02 计）"""
+    glon, glat = bd09_to_gcj02_np(lon, lat)
+    return solve_gcj02_inverse(glon, glat, tol=tol, max_iter=max_iter)
+
+def bd09_to_wgs84_np(lon, lat, tol=1e-7):
+    wlon, wlat, _, _ = solve_bd09_inverse(lon, lat, tol=tol)
+    return wlon, wlat
+
+# ---------- GCJ-02 快速模式（预计算偏移表） ----------
+# 偏移式可以拆成：只含经度的项 + 只含纬度的项 + 低次多项式，再乘以只随纬度变化的比例因子。
+# 预先按 FAST_STEP 步长把各一维项算成表（合计约 2 MB，可常驻 CPU 缓存），转换时查表线性插值，
+# 多项式部分照常精确计算；反解用同一套表做不动点迭代（收缩系数约 2e-3，3 轮足够）。
+# 105°E 落在表节点上（sqrt(|lon-105|) 在此不可导）。
+FAST_STEP = 1e-3
+FAST_LON = (73.0, 136.0)   # 覆盖 _out_of_china 的经纬度范围
+FAST_LAT = (3.0, 54.5)
+FAST_INVERSE_ITER = 3
+FAST_ERROR_SAMPLES = 200_000
+DEG_TO_M = 111_320.0       # 1 度约合米数（纬向），用于把误差换算成米
+
+def _axis(lo, hi, step):
+    return lo + step * np.arange(int(round((hi - lo) / step)) + 1)
+
+class GcjOffsetTables:
+    """WGS84 → GCJ-02 偏移的一维分量表；errors 为对照精确函数抽样得到的最大误差（度），首次 report 时计算"""
+    def __init__(self, step=FAST_STEP):
+        self.step = step
+        x = _axis(*FAST_LON, step) - 105.0
+        y = _axis(*FAST_LAT, step) - 35.0
+        zero_x, zero_y = np.zeros_like(x), np.zeros_like(y)
+        # 用原函数在另一变量取 0 时的值减去多项式部分，得到纯经度 / 纯纬度的项，保证与精确公式一致
+        self.tx_lat = _transform_lat_np(x, zero_x) - (-100.0 + 2.0*x)
+        self.tx_lon = _transform_lon_np(x, zero_x) - (300.0 + x + 0.1*x*x)
+        self.ty_lat = _transform_lat_np(zero_y, y) - (-100.0 + 3.0*y + 0.2*y*y)
+        radlat = (y + 35.0) / 180.0 * PI
+        magic = 1 - EE * np.sin(radlat) ** 2
+        sqrtmagic = np.sqrt(magic)
+        self.k_lat = 180.0 / ((A * (1 - EE)) / (magic * sqrtmagic) * PI)
+        self.k_lon = 180.0 / (A / sqrtmagic * np.cos(radlat) * PI)
+        self.errors = None
+
+    def _index(self, v, lo, n):
+        f = (v - lo) / self.step
+        i = np.clip(np.floor(f).astype(np.intp), 0, n - 2)
+        return i, f - i
+
+    @staticmethod
+    def _lerp(table, i, t):
+        a = table.take(i)
+        return a + (table.take(i + 1) - a) * t
+
+    def offset(self, lon, lat):
+        """(dlon, dlat)，lon/lat 须在 FAST_LON / FAST_LAT 范围内"""
+        i, ti = self._index(lon, FAST_LON[0], len(self.tx_lat))
+        j, tj = self._index(lat, FAST_LAT[0], len(self.ty_lat))
+        x = lon - 105.0
+        y = lat - 35.0
+        xy = 0.1 * x * y
+        raw_lat = -100.0 + 2.0*x + 3.0*y + 0.2*y*y + xy + self._lerp(self.tx_lat, i, ti) + self._lerp(self.ty_lat, j, tj)
+        raw_lon = 300.0 + x + 2.0*y + 0.1*x*x + xy + self._lerp(self.tx_lon, i, ti)
+        return raw_lon * self._lerp(self.k_lon, j, tj), raw_lat * self._lerp(self.k_lat, j, tj)
+
+    def forward(self, lon, lat):
+        return self._apply(lon, lat, inverse=False)
+
+    def inverse(self, lon, lat):
+        return self._apply(lon, lat, inverse=True)
+
+    def _apply(self, lon, lat, inverse):
+        """x/y 可为标量或数组；中国范围外（及 NaN）原样返回，与精确函数一致"""
+        scalar = np.ndim(lon) == 0
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        olon, olat = lon.copy(), lat.copy()
+        inside = np.flatnonzero(~_out_of_china_np(lon, lat))
+        if inside.size:
+            glon, glat = lon[inside], lat[inside]
+            if inverse:
+                wlon, wlat = glon, glat
+                for _ in range(FAST_INVERSE_ITER):
+                    dlon, dlat = self.offset(wlon, wlat)
+                    wlon, wlat = glon - dlon, glat - dlat
+                olon[inside], olat[inside] = wlon, wlat
+            else:
+                dlon, dlat = self.offset(glon, glat)
+                olon[inside], olat[inside] = glon + dlon, glat + dlat
+        return (float(olon[0]), float(olat[0])) if scalar else (olon, olat)
+
+    def measure_errors(self):
+        """
+        对照精确函数的最大误差（度）：经度表每个区间的中点（线性插值误差最大处）配随机纬度，
+        再加中国范围内均匀随机点；范围内缩 0.05°，避开边界上精确反解本身不收敛的点
+        """
+        if self.errors is None:
+            rng = np.random.default_rng(0)
+            mid = _axis(*FAST_LON, self.step)[:-1] + self.step / 2
+            mid = mid[(mid > 73.71) & (mid < 135.0)]
+            lon = np.concatenate([mid, rng.uniform(73.71, 135.0, FAST_ERROR_SAMPLES)])
+            lat = rng.uniform(3.91, 53.5, lon.size)
+            rlon, rlat = wgs84_to_gcj02_np(lon, lat)
+            flon, flat = self.forward(lon, lat)
+            wlon, wlat, _, _ = solve_gcj02_inverse(lon, lat, tol=1e-12, max_iter=50)
+            ilon, ilat = self.inverse(lon, lat)
+            self.errors = {
+                "forward": float(max(np.abs(flon - rlon).max(), np.abs(flat - rlat).max())),
+                "inverse": float(max(np.abs(ilon - wlon).max(), np.abs(ilat - wlat).max())),
+            }
+        return self.errors
+
+@lru_cache(maxsize=1)
+def get_gcj_tables():
+    """进程内只建一次（毫秒级，无需落盘）"""
+    return GcjOffsetTables()
+
+def wgs84_to_gcj02_fast(lon, lat):
+    return get_gcj_tables().forward(lon, lat)
+
+def gcj02_to_wgs84_fast(lon, lat):
+    return get_gcj_tables().inverse(lon, lat)
+
+def fast_mode_report():
+    """快速模式最大误差说明（抽样计算，约 1 秒，进程内缓存），供日志显示"""
+    errors = get_gcj_tables().measure_errors()
+    return [f"快速模式 {label} 最大误差：{errors[k]:.1e}°（约 {errors[k] * DEG_TO_M * 1000:.2f} mm）"
+            for k, label in (("forward", "WGS84→GCJ-02"), ("inverse", "GCJ-02→WGS84"))]
+
 # ---------- transform pipeline ----------
-def make_proj_transform(src_spec: str, dst_spec: str):
+@lru_cache(maxsize=32)
+def get_transformer(src: str, dst: str):
+    """进程级 Transformer 缓存（按 (src, dst) 键，LRU 淘汰），避免重复 from_crs"""
+    return Transformer.from_crs(CRS.from_user_input(src), CRS.from_user_input(dst), always_xy=True)
+
+def make_proj_transform(src_spec: str, dst_spec: str, fast=False):
+    """
+    返回 f(x, y)：x/y 可以是标量，也可以是整列（NumPy 数组），数组时整列一次计算。
+    fast=True 时 GCJ-02 / BD-09 → WGS84 的反解走预计算偏移表（误差见 fast_mode_report）；
+    正向整列公式本身已够快，查表并不更快，仍用精确公式。
+    f.crs 记录构造参数，多进程转换时子进程据此重建 f
+    """
     s = src_spec.upper().strip()
     d = dst_spec.upper().strip()
     def is_wgs84(tag): return tag in ("EPSG:4326", "WGS84")
+    def is_array(v): return np.ndim(v) > 0
 
     if s.startswith("EPSG:") and d.startswith("EPSG:"):
-        tr = Transformer.from_crs(CRS.from_user_input(s), CRS.from_user_input(d), always_xy=True)
-        return lambda x, y: tr.transform(x, y)
+        tr = get_transformer(s, d)
+        f = lambda x, y: tr.transform(x, y)
+        f.crs = (src_spec, dst_spec, fast)
+        return f
 
     def to_wgs84(x, y):
-        if s == "GCJ-02":   return gcj02_to_wgs84(x, y)
-        if s == "BD-09":    return bd09_to_wgs84(x, y)
+        if fast and s in ("GCJ-02", "BD-09"):
+            if s == "BD-09":
+                x, y = bd09_to_gcj02_np(x, y) if is_array(x) else bd09_to_gcj02(x, y)
+            return gcj02_to_wgs84_fast(x, y)
+        if s == "GCJ-02":   return gcj02_to_wgs84_np(x, y) if is_array(x) else gcj02_to_wgs84(x, y)
+        if s == "BD-09":    return bd09_to_wgs84_np(x, y) if is_array(x) else bd09_to_wgs84(x, y)
         if is_wgs84(s):     return x, y
-        t = Transformer.from_crs(CRS.from_user_input(s), CRS.from_user_input("EPSG:4326"), always_xy=True)
-        return t.transform(x, y)
+        return get_transformer(s, "EPSG:4326").transform(x, y)
 
     def from_wgs84(x, y):
-        if d == "GCJ-02":   return wgs84_to_gcj02(x, y)
-        if d == "BD-09":    return wgs84_to_bd09(x, y)
+        if d == "GCJ-02":   return wgs84_to_gcj02_np(x, y) if is_array(x) else wgs84_to_gcj02(x, y)
+        if d == "BD-09":    return wgs84_to_bd09_np(x, y) if is_array(x) else wgs84_to_bd09(x, y)
         if is_wgs84(d):     return x, y
-        t = Transformer.from_crs(CRS.from_user_input("EPSG:4326"), CRS.from_user_input(d), always_xy=True)
-        return t.transform(x, y)
+        return get_transformer("EPSG:4326", d).transform(x, y)
+
+    f = lambda x, y: from_wgs84(*to_wgs84(x, y))
+    f.crs = (src_spec, dst_spec, fast)
+    return f
+
+TRANSFORM_CHUNK = 200_000     # 整列转换的分块行数（进度回报与取消的粒度）
+PARALLEL_MIN_ROWS = 500_000   # 少于该行数时串行：进程池分发与拷贝的开销不划算
+MAX_WORKERS = 61 if os.name == "nt" else 256  # Windows 进程池上限为 61
+
+def default_workers():
+    return min(os.cpu_count() or 1, MAX_WORKERS)
+
+def _factorize_xy(x, y):
+    """
+    坐标对分组：返回 (每行所属组号, 每组首次出现的行号)。
+    先把 X/Y 的位模式混合成一个 uint64 走 pandas 哈希表（比 np.unique 排序快一个数量级），
+    再逐行核对组内坐标；万一出现 64 位哈希碰撞，退回按 16 字节精确去重
+    """
+    xb = np.ascontiguousarray(x, dtype=np.float64).view(np.uint64)
+    yb = np.ascontiguousarray(y, dtype=np.float64).view(np.uint64)
+    key = (xb * np.uint64(0x9E3779B97F4A7C15)) ^ ((yb << np.uint64(1)) | (yb >> np.uint64(63)))
+    codes, uniq = pd.factorize(key)
+    first = np.empty(len(uniq), dtype=np.intp)
+    first[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+    if not (np.array_equal(x[first][codes], x) and np.array_equal(y[first][codes], y)):
+        rows = np.ascontiguousarray(np.stack([x, y], axis=1)).view(np.dtype((np.void, 16))).ravel()
+        _, first, codes = np.unique(rows, return_index=True, return_inverse=True)
+    return codes, first
+
+class CoordDedup:
+    """
+    坐标去重：同一批里重复的 X/Y 只转换一次，结果按行散回。
+    decimals 不为 None 时先按该小数位取整再去重（转换的是取整后的坐标）。
+    多次调用累计行数、去重后点数与耗时，summary() 给出重复比例与估算节省的时间
+    """
+    def __init__(self, decimals=None):
+        self.decimals = decimals
+        self.rows = 0
+        self.unique = 0
+        self.seconds = 0.0      # 去重 + 转换 + 散回的实际耗时
+        self.est_seconds = 0.0  # 按去重后转换速度折算的不去重耗时
+
+    def transform(self, x, y, compute):
+        t0 = time.perf_counter()
+        n = len(x)
+        x_out = np.full(n, np.nan)
+        y_out = np.full(n, np.nan)
+        valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        vx, vy = x[valid], y[valid]
+        if self.decimals is not None:
+            vx, vy = np.round(vx, self.decimals), np.round(vy, self.decimals)
+        codes, first = _factorize_xy(vx, vy)
+        t1 = time.perf_counter()
+        ux, uy = compute(vx[first], vy[first])
+        t_compute = time.perf_counter() - t1
+        x_out[valid], y_out[valid] = np.asarray(ux)[codes], np.asarray(uy)[codes]
+        self.rows += len(valid)
+        self.unique += len(first)
+        self.seconds += time.perf_counter() - t0
+        if len(first):
+            self.est_seconds += t_compute * len(valid) / len(first)
+        return x_out, y_out
+
+    def summary(self):
+        dup = 1 - self.unique / self.rows if self.rows else 0.0
+        saved = self.est_seconds - self.seconds
+        head = f"坐标去重：{self.rows:,} 行中不同坐标 {self.unique:,} 个，重复 {dup:.1%}；"
+        return head + (f"估计节省 {saved:.2f}s" if saved >= 0 else f"去重额外耗时 {-saved:.2f}s")
+
+def transform_columns(f, x, y, chunk_size=TRANSFORM_CHUNK, progress=None, workers=1, cache=None, dedup=None):
+    """
+    分块转换整列坐标：x/y 为 float64 数组，NaN 表示无效值，对应输出也为 NaN。
+    progress(done, total, stage) 每块回调一次，可抛异常以中止。
+    workers > 1 且行数不少于 PARALLEL_MIN_ROWS 时分发到进程池（f 须来自 make_proj_transform）。
+    cache 为 TransformCache 时先查磁盘缓存，只转换未命中的行；
+    dedup 为 CoordDedup 时只转换不重复的坐标（再对它们查缓存）
+    """
+    if dedup is not None:
+        return dedup.transform(x, y, lambda ux, uy: transform_columns(f, ux, uy, chunk_size, progress, workers, cache))
+    if cache is not None and hasattr(f, "crs"):
+        return cache.transform(f.crs, x, y, lambda cx, cy: transform_columns(f, cx, cy, chunk_size, progress, workers))
+    n = len(x)
+    if workers > 1 and n >= PARALLEL_MIN_ROWS and hasattr(f, "crs"):
+        return _transform_columns_parallel(f.crs, x, y, workers, chunk_size, progress)
+    x_out = np.full(n, np.nan)
+    y_out = np.full(n, np.nan)
+    if progress: progress(0, n, "转换")
+    for start in range(0, n, chunk_size):
+        sl = slice(start, start + chunk_size)
+        valid = ~(np.isnan(x[sl]) | np.isnan(y[sl]))
+        if valid.any():
+            x_out[sl][valid], y_out[sl][valid] = f(x[sl][valid], y[sl][valid])
+        if progress: progress(min(start + chunk_size, n), n, "转换")
+    return x_out, y_out
+
+# ---------- 多进程转换 ----------
+_pool = None
+_pool_workers = 0
+
+def get_pool(workers):
+    """复用同一个进程池（子进程导入 pyproj 等只付一次开销）；进程数变化时重建"""
+    global _pool, _pool_workers
+    workers = min(workers, MAX_WORKERS)
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+def _transform_shared(shm_name, n, crs, start, stop):
+    """子进程：挂接共享内存 [x, y, x_out, y_out]，原地转换 [start, stop) 行"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buf = np.ndarray((4, n), dtype=np.float64, buffer=shm.buf)
+        f = make_proj_transform(*crs)
+        buf[2, start:stop], buf[3, start:stop] = transform_columns(f, buf[0, start:stop], buf[1, start:stop])
+        del buf
+    finally:
+        shm.close()
+    return stop - start
+
+def _transform_columns_parallel(crs, x, y, workers, chunk_size, progress):
+    """
+    输入输出放在一块共享内存里，子任务只传 (名称, 行范围)，不序列化数组；
+    每个子任务写回自己的行范围，结果天然保持原顺序
+    """
+    n = len(x)
+    step = max(1, min(chunk_size, -(-n // (workers * 4))))  # 每个进程至少分到几块，负载更均衡
+    shm = shared_memory.SharedMemory(create=True, size=4 * n * 8)
+    try:
+        buf = np.ndarray((4, n), dtype=np.float64, buffer=shm.buf)
+        buf[0], buf[1] = x, y
+        pool = get_pool(workers)
+        futs = [pool.submit(_transform_shared, shm.name, n, crs, start, min(start + step, n))
+                for start in range(0, n, step)]
+        done = 0
+        if progress: progress(0, n, "转换")
+        try:
+            for fut in as_completed(futs):
+                done += fut.result()
+                if progress: progress(done, n, "转换")
+        except BaseException:
+            for fut in futs:
+                fut.cancel()
+            wait(futs)  # 正在运行的子任务结束后才能释放共享内存
+            raise
+        x_out, y_out = buf[2].copy(), buf[3].copy()
+        del buf
+        return x_out, y_out
+    finally:
+        shm.close()
+        shm.unlink()
+
+# ---------- 输出后端（按输出文件扩展名选择） ----------
+WRITE_CHUNK = 50_000  # 流式写出的分块行数
+XLSX_MAX_ROWS = 1_048_576  # xlsx 单表行数上限（含表头）
+
+def _frame_rows(df):
+    """df 的行（NaN/NA → None）"""
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+class XlsxSink:
+    """openpyxl 只写模式逐块流式写出 XLSX，内存不随行数增长"""
+    def __init__(self, out_path):
+        self.out_path = out_path
+        self.wb = openpyxl.Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+        self.header_done = False
+        self.rows = 0
+
+    def write(self, df):
+        self.rows += len(df)
+        if self.rows > XLSX_MAX_ROWS - 1:
+            raise ValueError(f"超过 XLSX 单表上限 {XLSX_MAX_ROWS:,} 行，请改用 .csv 或 .parquet 输出")
+        if not self.header_done:
+            self.ws.append([str(c) for c in df.columns])
+            self.header_done = True
+        for row in _frame_rows(df):
+            self.ws.append(row)
+
+    def close(self):
+        self.wb.save(self.out_path)
+
+class CsvSink:
+    """UTF-8（带 BOM，Excel 直接打开不乱码）CSV，逐块追加写出"""
+    def __init__(self, out_path):
+        self.f = open(out_path, "w", encoding="utf-8-sig", newline="")
+        self.header_done = False
+
+    def write(self, df):
+        df.to_csv(self.f, index=False, header=not self.header_done)
+        self.header_done = True
+
+    def close(self):
+        self.f.close()
+
+class ParquetSink:
+    """
+    Parquet（需要 pyarrow），每块写成一个行组；表结构取自第一块，
+    全空列按字符串处理，混合类型的文本列统一转为字符串，避免 Arrow 类型推断失败
+    """
+    def __init__(self, out_path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("写出 Parquet 需要安装 pyarrow")
+        self.pa, self.pq = pa, pq
+        self.out_path = out_path
+        self.writer = None
+
+    def write(self, df):
+        pa = self.pa
+        df = df.copy(deep=False)
+        for c in df.columns:
+            if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True).startswith("mixed"):
+                df[c] = df[c].astype("string")
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema],
+                               metadata=table.schema.metadata)
+            self.writer = self.pq.ParquetWriter(self.out_path, schema)
+        table = pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+OUTPUT_SINKS = {".xlsx": XlsxSink, ".csv": CsvSink, ".parquet": ParquetSink}
+
+class AtomicOutput:
+    """
+    先写到输出文件旁的临时文件，close() 成功后再 os.replace 到目标位置；
+    abort()（出错或取消）删除临时文件，已有的输出文件不会被半截结果覆盖
+    """
+    def __init__(self, sink_cls, out_path):
+        base, ext = os.path.splitext(out_path)
+        self.out_path = out_path
+        self.tmp_path = f"{base}.{os.getpid()}.tmp{ext}"
+        self.sink = sink_cls(self.tmp_path)
+
+    def write(self, df):
+        self.sink.write(df)
+
+    def close(self):
+        # 保存或改名失败（如 Windows 上目标文件正被 Excel 打开）时同样删掉临时文件，再把原错误抛出
+        try:
+            self.sink.close()
+            os.replace(self.tmp_path, self.out_path)
+        except BaseException:
+            self._remove_tmp()
+            raise
 
-    return lambda x, y: from_wgs84(*to_wgs84(x, y))
+    def abort(self):
+        try:
+            self.sink.close()
+        except Exception:
+            pass
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        try:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+def open_output(out_path):
+    """
+    按扩展名打开输出：返回带 write(df) / close() / abort() 的写出器（见 AtomicOutput）；
+    所有后端都保留原列并附加 X_out / Y_out
+    """
+    ext = os.path.splitext(out_path)[1].lower()
+    if ext not in OUTPUT_SINKS:
+        raise ValueError(f"不支持的输出格式：{ext or '(无扩展名)'}，可选 {'/'.join(OUTPUT_SINKS)}")
+    return AtomicOutput(OUTPUT_SINKS[ext], out_path)
+
+def write_output(df, out_path, chunk_size=WRITE_CHUNK, progress=None):
+    """整表分块写出，每块回调一次 progress"""
+    n = len(df)
+    sink = open_output(out_path)
+    try:
+        if progress: progress(0, n, "写出")
+        for start in range(0, max(n, 1), chunk_size):
+            sink.write(df.iloc[start:start + chunk_size])
+            if progress: progress(min(start + chunk_size, n), n, "写出")
+    except BaseException:
+        sink.abort()
+        raise
+    sink.close()
+
+def _parquet_numeric(chunk, dtypes, start):
+    """
+    CSV → Parquet：Parquet 每列只有一个类型，由首块决定——首块中整列都能还原为数值的列写成 Int64 / float64，
+    其余保持文本；dtypes 记录首块的决定，后续块按同一类型转换，放不进去时报错（而不是写出混合类型）
+    """
+    first = not dtypes
+    for c in chunk.columns[:-2]:
+        if first:
+            conv = csv_numeric(chunk[c])
+            dtypes[c] = None if conv is None else str(conv.dtype)
+        elif dtypes[c] is None:
+            continue
+        else:
+            conv = csv_numeric(chunk[c], dtypes[c])
+            if conv is None and chunk[c].notna().any():
+                raise ValueError(f"列 {c} 在第 {start + 1:,} 行之后出现与前面类型不符的值（前面按 {dtypes[c]} 写出），"
+                                 f"请改用 .csv 或 .xlsx 输出")
+        if conv is not None:
+            chunk[c] = conv
+
+def convert_table(path, xcol, ycol, f, out_path, chunk_size=FRAME_CHUNK, progress=None, prof=None, workers=1,
+                  cache=None, dedup=None):
+    """
+    CSV / Parquet 输入：逐块读取 → 转换 → 写出，每块读完直接进入转换与写出，内存只与块大小有关。
+    prof 为 StageProfiler 时按 读取 / 解析 / 转换 / 写出 分阶段计时。
+    workers > 1 时每块放大到 PARALLEL_MIN_ROWS 行，块内多进程转换；cache / dedup 见 transform_columns。
+    返回 (总行数, 无法转为数值的值个数)
+    """
+    prof = prof or StageProfiler(enabled=False)
+    if workers > 1:
+        chunk_size = max(chunk_size, PARALLEL_MIN_ROWS)
+    total = table_row_count(path)
+    n_total = n_nan = 0
+    sink = open_output(out_path)
+    # CSV 按文本读入：写 XLSX 时把数字逐个还原为数值单元格；写 Parquet 时按首块确定数值列（见 _parquet_numeric），
+    # CSV 输出保留原文
+    from_csv = not path.lower().endswith(".parquet")
+    restore = from_csv and isinstance(sink.sink, XlsxSink)
+    numeric = {} if from_csv and isinstance(sink.sink, ParquetSink) else None
+    try:
+        if progress: progress(0, total, "转换")
+        for chunk in prof.iter("读取", iter_table_frames(path, chunk_size=chunk_size), count=len):
+            n = len(chunk)
+            with prof.stage("解析", rows=n):
+                x = pd.to_numeric(chunk[xcol], errors="coerce")
+                y = pd.to_numeric(chunk[ycol], errors="coerce")
+                n_nan += int(x.isna().sum() + y.isna().sum())
+            with prof.stage("转换", rows=n):
+                chunk["X_out"], chunk["Y_out"] = transform_columns(
+                    f, x.to_numpy(dtype=np.float64), y.to_numpy(dtype=np.float64), workers=workers, cache=cache, dedup=dedup)
+            with prof.stage("写出", rows=n):
+                if restore:
+                    for c in chunk.columns[:-2]:
+                        chunk[c] = csv_values(chunk[c])
+                elif numeric is not None:
+                    _parquet_numeric(chunk, numeric, n_total)
+                sink.write(chunk)
+            n_total += n
+            if progress: progress(n_total, total, "转换")
+    except BaseException:
+        sink.abort()
+        raise
+    sink.close()
+    return n_total, n_nan
 
 def resolve_crs(preset_name: str, epsg_text: str) -> str:
     epsg_text = (epsg_text or "").strip()
@@ -134,7 +733,7 @@ class ConverterApp(tk.Tk):
 
         # 文件与sheet
         frm1 = ttk.Frame(self); frm1.pack(fill="x", padx=8, pady=6)
-        ttk.Label(frm1, text="Excel 文件").pack(side="left")
+        ttk.Label(frm1, text="数据文件").pack(side="left")
         self.var_file = tk.StringVar()
         ttk.Entry(frm1, textvariable=self.var_file, width=70).pack(side="left", padx=6)
         ttk.Button(frm1, text="浏览", command=self.pick_file).pack(side="left")
@@ -170,56 +769,77 @@ class ConverterApp(tk.Tk):
         ttk.Label(frm4, text="输出文件").pack(side="left")
         self.var_out = tk.StringVar(); ttk.Entry(frm4, textvariable=self.var_out, width=70).pack(side="left", padx=6)
         ttk.Button(frm4, text="选择", command=self.pick_save).pack(side="left")
+        self.var_profile = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frm4, text="保存性能分析 JSON", variable=self.var_profile).pack(side="left", padx=6)
 
         # 按钮 & 日志
         frm5 = ttk.Frame(self); frm5.pack(fill="x", padx=8, pady=6)
-        ttk.Button(frm5, text="开始转换", command=self.run).pack(side="left")
+        self.btn_run = ttk.Button(frm5, text="开始转换", command=self.run); self.btn_run.pack(side="left")
         ttk.Button(frm5, text="预览前5行", command=self.preview).pack(side="left", padx=6)
+        self.btn_cancel = ttk.Button(frm5, text="取消", command=self.cancel, state="disabled")
+        self.btn_cancel.pack(side="left")
+        ttk.Label(frm5, text="进程数").pack(side="left", padx=(12, 0))
+        self.var_workers = tk.IntVar(value=default_workers())
+        ttk.Spinbox(frm5, from_=1, to=MAX_WORKERS, textvariable=self.var_workers, width=5).pack(side="left", padx=6)
+        self.var_fast = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frm5, text="快速模式（GCJ-02/BD-09 反解查表，误差约毫米级）",
+                        variable=self.var_fast).pack(side="left", padx=6)
+        self.var_cache = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frm5, text="缓存转换结果", variable=self.var_cache).pack(side="left", padx=6)
+        self.var_dedup = tk.BooleanVar(value=True)
+        ttk.Checkbutton(frm5, text="重复坐标只转一次，取整小数位(选填)", variable=self.var_dedup).pack(side="left")
+        self.var_dedup_decimals = tk.StringVar()
+        ttk.Entry(frm5, textvariable=self.var_dedup_decimals, width=4).pack(side="left", padx=(2, 6))
 
         self.log = ScrolledText(self, height=14); self.log.pack(fill="both", expand=True, padx=8, pady=6)
         ttk.Label(self, text="© 2025 by Arope", anchor="center").pack(side="bottom", pady=4)
 
         self.df_preview = None
+        self.task = None
 
     def log_print(self, *msg):
         self.log.insert("end", " ".join(map(str,msg)) + "\n")
         self.log.see("end")
 
     def pick_file(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel","*.xlsx;*.xls")])
+        path = filedialog.askopenfilename(filetypes=[("Excel / CSV / Parquet","*.xlsx;*.xls;*.csv;*.parquet"),
+                                                     ("Excel","*.xlsx;*.xls"), ("CSV","*.csv"), ("Parquet","*.parquet")])
         if not path: return
         self.var_file.set(path)
         try:
-            xls = pd.ExcelFile(path)
-            self.cmb_sheet["values"] = xls.sheet_names
-            if xls.sheet_names:
-                self.cmb_sheet.set(xls.sheet_names[0])
+            sheet_names = get_session(path).sheet_names
+            self.cmb_sheet["values"] = sheet_names
+            if sheet_names:
+                self.cmb_sheet.set(sheet_names[0])
                 self.load_sheet_preview()
-            base, _ = os.path.splitext(path)
+            base, ext = os.path.splitext(path)
             if not self.var_out.get():
-                self.var_out.set(base + "_converted.xlsx")
-            self.log_print(f"已加载：{os.path.basename(path)}；sheets={xls.sheet_names}")
+                # CSV / Parquet 输入默认输出同格式
+                self.var_out.set(base + "_converted" + (ext.lower() if is_table_file(path) else ".xlsx"))
+            self.log_print(f"已加载：{os.path.basename(path)}；sheets={sheet_names}")
         except Exception as e:
-            messagebox.showerror("错误", f"读取Excel失败：{e}")
+            messagebox.showerror("错误", f"读取文件失败：{e}")
 
     def load_sheet_preview(self, *_):
         path = self.var_file.get()
         sheet = self.cmb_sheet.get()
         if not (path and sheet): return
-        df = pd.read_excel(path, sheet_name=sheet, nrows=200)
-        self.df_preview = df
-        cols = list(df.columns)
+        # 表头与前 200 行来自工作簿会话缓存，切换 sheet 不重复打开文件
+        headers, rows = get_session(path).preview(sheet)
+        self.df_preview = pd.DataFrame(rows, columns=headers)
+        cols = headers
         self.cmb_x["values"] = cols
         self.cmb_y["values"] = cols
         self.log_print(f"切换到 sheet={sheet}；列={cols}")
 
     def preview(self):
         if self.df_preview is None:
-            self.log_print("请先选择 Excel 文件。"); return
+            self.log_print("请先选择数据文件。"); return
         self.log_print(self.df_preview.head().to_string())
 
     def pick_save(self):
-        path = filedialog.asksaveasfilename(defaultextension=".xlsx",filetypes=[("Excel","*.xlsx")])
+        path = filedialog.asksaveasfilename(defaultextension=".xlsx",
+                                            filetypes=[("Excel","*.xlsx"), ("CSV","*.csv"), ("Parquet","*.parquet")])
         if path: self.var_out.set(path)
 
     def run(self):
@@ -231,41 +851,128 @@ class ConverterApp(tk.Tk):
             out_path = self.var_out.get()
 
             if not (path and os.path.exists(path)):
-                self.log_print("[错误] 请选择有效的 Excel 文件。"); return
+                self.log_print("[错误] 请选择有效的数据文件。"); return
             if not sheet:
                 self.log_print("[错误] 请选择 Sheet。"); return
             if not (xcol and ycol):
                 self.log_print("[错误] 请选择 X/Y 列。"); return
             if not out_path:
                 base,_ = os.path.splitext(path); out_path = base + "_converted.xlsx"
+            if os.path.splitext(out_path)[1].lower() not in OUTPUT_SINKS:
+                self.log_print(f"[错误] 输出文件扩展名须为 {'/'.join(OUTPUT_SINKS)}。"); return
 
             src = resolve_crs(self.cmb_src.get(), self.var_src_epsg.get())
             dst = resolve_crs(self.cmb_dst.get(), self.var_dst_epsg.get())
             self.log_print(f"坐标系：{src} -> {dst}")
 
-            df = pd.read_excel(path, sheet_name=sheet)
-            if xcol not in df.columns or ycol not in df.columns:
+            session = get_session(path)
+            headers = session.headers(sheet)
+            if xcol not in headers or ycol not in headers:
                 self.log_print("[错误] X/Y 列不存在于表头。"); return
 
-            x = pd.to_numeric(df[xcol], errors="coerce")
-            y = pd.to_numeric(df[ycol], errors="coerce")
-            n_total = len(df)
-            n_nan = int(x.isna().sum() + y.isna().sum())
-            if n_nan > 0:
-                self.log_print(f"[提示] 有 {n_nan} 个值无法转换为数值，已按 NaN 处理。")
-
-            f = make_proj_transform(src, dst)
-            out_xy = [f(xv, yv) if pd.notna(xv) and pd.notna(yv) else (None, None) for xv,yv in zip(x,y)]
-            df["X_out"] = [p[0] for p in out_xy]
-            df["Y_out"] = [p[1] for p in out_xy]
-
-            df.to_excel(out_path, index=False)
-            self.log_print(f"✅ 完成：共 {n_total} 行 → 保存到：{out_path}")
-            messagebox.showinfo("成功", "转换完成！")
+            try:
+                workers = max(1, self.var_workers.get())
+            except tk.TclError:
+                self.log_print("[错误] 进程数须为整数。"); return
+            fast = self.var_fast.get()
+            save_profile = self.var_profile.get()
+            prof = StageProfiler(trace_memory=trace_memory_requested())
+            use_cache = self.var_cache.get()
+            dedup = None
+            if self.var_dedup.get():
+                decimals = self.var_dedup_decimals.get().strip()
+                if decimals and not decimals.isdigit():
+                    self.log_print("[错误] 取整小数位须为非负整数。"); return
+                dedup = CoordDedup(int(decimals) if decimals else None)
+            cache = None
+
+            def convert(task):
+                nonlocal cache
+                f = make_proj_transform(src, dst, fast=fast)
+                if use_cache:
+                    cache = TransformCache()
+                if fast and src in ("GCJ-02", "BD-09"):
+                    for line in fast_mode_report():
+                        task.log(line)
+                if session.is_table:
+                    # CSV / Parquet：逐块读取、转换、写出
+                    n_total, n_nan = convert_table(path, xcol, ycol, f, out_path, progress=task.progress,
+                                                   prof=prof, workers=workers, cache=cache, dedup=dedup)
+                    if n_nan > 0:
+                        task.log(f"[提示] 有 {n_nan} 个值无法转换为数值，已按 NaN 处理。")
+                    return n_total
+
+                task.log("读取中…")
+                with prof.stage("读取"):
+                    rows = session.iter_rows(sheet)
+                    next(rows, None)  # 表头已在会话中
+                    width = len(headers)
+                    # 逐行汇报进度，读取大表时也能看到进度并随时取消
+                    rows = iter_progress(rows, task.progress, sheet_row_count(path, sheet), "读取")
+                    df = pd.DataFrame.from_records((fit_row(r, width) for r in rows), columns=headers)
+                n_total = len(df)
+                prof.add_rows("读取", n_total)
+
+                with prof.stage("解析", rows=n_total):
+                    x = pd.to_numeric(df[xcol], errors="coerce")
+                    y = pd.to_numeric(df[ycol], errors="coerce")
+                    n_nan = int(x.isna().sum() + y.isna().sum())
+                if n_nan > 0:
+                    task.log(f"[提示] 有 {n_nan} 个值无法转换为数值，已按 NaN 处理。")
+
+                # 分块整列转换；无效行保持 NaN（写出为空单元格）
+                with prof.stage("转换", rows=n_total):
+                    df["X_out"], df["Y_out"] = transform_columns(
+                        f, x.to_numpy(dtype=np.float64), y.to_numpy(dtype=np.float64),
+                        progress=task.progress, workers=workers, cache=cache, dedup=dedup)
+
+                with prof.stage("写出", rows=n_total):
+                    write_output(df, out_path, progress=task.progress)
+                return n_total
+
+            def job(task):
+                prof.start()
+                try:
+                    return convert(task)
+                finally:
+                    prof.stop()
+
+            def done(n_total, err):
+                self.task = None
+                self.btn_run.config(state="normal")
+                self.btn_cancel.config(state="disabled")
+                if isinstance(err, TaskCancelled):
+                    self.log_print("已取消，未写出输出文件。")
+                elif err is not None:
+                    self.log_print("[错误]", err)
+                    messagebox.showerror("错误", str(err))
+                else:
+                    for line in prof.summary_lines():
+                        self.log_print(line)
+                    if dedup is not None:
+                        self.log_print(dedup.summary())
+                    if cache is not None:
+                        self.log_print(cache.summary())
+                    if save_profile:
+                        p = prof.write_json(profile_path(out_path), tool="app_tk", input=path, sheet=sheet,
+                                            src=src, dst=dst, rows=n_total)
+                        self.log_print(f"性能分析已保存：{p}")
+                    self.log_print(f"✅ 完成：共 {n_total} 行 → 保存到：{out_path}")
+                    messagebox.showinfo("成功", "转换完成！")
+
+            self.btn_run.config(state="disabled")
+            self.btn_cancel.config(state="normal")
+            self.task = BackgroundTask(self, job, self.log_print, done).start()
         except Exception as e:
             self.log_print("[错误]", e)
             messagebox.showerror("错误", str(e))
 
+    def cancel(self):
+        if self.task and self.task.running:
+            self.task.cancel()
+            self.log_print("正在取消（当前块完成后停止）…")
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后的 EXE 中子进程从这里进入
     ConverterApp().mainloop()
 
@@ -0,0 +1,134 @@
+"""
+批量导出命令行（无界面）：按 glob 匹配多个工作簿，把每个 (文件, Sheet) 作为一个任务，
+分发到进程池并行转换坐标并导出 Shapefile / GeoJSON，最后打印每个任务的吞吐与失败汇总。
+
+示例：
+    python batch_cli.py "deliveries/*.xlsx" --x 经度 --y 纬度 --src BD-09 --dst EPSG:3857 \\
+        --format shp --out-dir out -j 8
+"""
+import os, re, sys, glob, time, argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import freeze_support
+
+from app_tk import PRESETS, fast_mode_report, make_proj_transform, resolve_crs
+from excel_to_vector_tk import FORMAT_EXT, export_sheet, output_epsg
+from spatial_index import CURVES
+from workbook_session import get_session, is_table_file
+
+def parse_crs(text):
+    """接受预设名、GCJ-02 / BD-09、EPSG:xxxx 或纯数字，返回 resolve_crs 格式"""
+    text = (text or "").strip()
+    for name, code in PRESETS:
+        if text == name or text.upper() == code:
+            return code
+    return resolve_crs("", text)
+
+def list_jobs(patterns, sheets=None):
+    """展开 glob，返回 [(文件, Sheet)]；sheets 为空时取每个文件的全部 Sheet"""
+    files = sorted({p for pat in patterns for p in glob.glob(pat, recursive=True)})
+    jobs, errors = [], []
+    for path in files:
+        if is_table_file(path):  # CSV / Parquet 只有一个“sheet”
+            jobs.append((path, os.path.basename(path)))
+            continue
+        try:
+            names = get_session(path).sheet_names  # xlsx 走 openpyxl，xls 走 pandas
+        except Exception as e:
+            errors.append((path, "", str(e)))
+            continue
+        for sheet in names:
+            if not sheets or sheet in sheets:
+                jobs.append((path, sheet))
+    return jobs, errors
+
+def job_out_path(out_dir, path, sheet, fmt):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    safe_sheet = re.sub(r'[\\/:*?"<>|\s]+', "_", sheet)
+    return os.path.join(out_dir, f"{stem}_{safe_sheet}{FORMAT_EXT[fmt]}")
+
+def run_job(job):
+    """进程池中执行的单个任务，返回结果字典（异常也作为结果返回，不抛出）"""
+    path, sheet, opts = job
+    out_path = job_out_path(opts["out_dir"], path, sheet, opts["fmt"])
+    t0 = time.perf_counter()
+    res = {"file": path, "sheet": sheet, "out": out_path, "points": 0, "error": None}
+    try:
+        src, dst = opts["src"], opts["dst"]
+        transform = make_proj_transform(src, dst, fast=opts["fast"]) if src != dst else None
+        res["points"] = export_sheet(path, sheet, opts["x"], opts["y"], out_path, fmt=opts["fmt"],
+                                     epsg=output_epsg(dst), precision=opts["precision"],
+                                     transform=transform, log=lambda *_: None,
+                                     order=opts["order"], qix=opts["qix"], parallel=opts["parallel"])
+    except Exception as e:
+        res["error"] = f"{type(e).__name__}: {e}"
+    res["seconds"] = time.perf_counter() - t0
+    return res
+
+def print_summary(results, errors, wall):
+    ok = [r for r in results if not r["error"]]
+    failed = [r for r in results if r["error"]]
+    print("\n==== 汇总 ====")
+    for r in results:
+        rate = r["points"] / r["seconds"] if r["seconds"] > 0 else 0.0
+        status = "失败" if r["error"] else "成功"
+        print(f"[{status}] {os.path.basename(r['file'])} / {r['sheet']}: "
+              f"{r['points']} 点, {r['seconds']:.2f}s, {rate:,.0f} 点/秒")
+    total = sum(r["points"] for r in ok)
+    print(f"任务 {len(results)} 个：成功 {len(ok)}，失败 {len(failed) + len(errors)}；"
+          f"共 {total} 点，总耗时 {wall:.2f}s（{total / wall if wall > 0 else 0:,.0f} 点/秒）")
+    if failed or errors:
+        print("\n==== 失败 ====")
+        for path, sheet, msg in errors:
+            print(f"{path}: {msg}")
+        for r in failed:
+            print(f"{r['file']} / {r['sheet']}: {r['error']}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="批量 Excel → Shapefile / GeoJSON（可选坐标转换）")
+    ap.add_argument("patterns", nargs="+", help="工作簿 / CSV / Parquet 的 glob，如 \"data/**/*.xlsx\"")
+    ap.add_argument("--x", required=True, help="X 列名（经度/东向）")
+    ap.add_argument("--y", required=True, help="Y 列名（纬度/北向）")
+    ap.add_argument("--src", default="EPSG:4326", help="输入坐标系：EPSG 编码、GCJ-02 或 BD-09")
+    ap.add_argument("--dst", default=None, help="输出坐标系，默认与输入相同")
+    ap.add_argument("--format", dest="fmt", choices=sorted(FORMAT_EXT), default="shp")
+    ap.add_argument("--sheet", action="append", dest="sheets", help="只处理指定 Sheet，可重复；默认全部")
+    ap.add_argument("--out-dir", default="out")
+    ap.add_argument("--precision", type=int, default=None, help="GeoJSON 坐标小数位")
+    ap.add_argument("--order", choices=CURVES, default=None, help="Shapefile 按空间填充曲线排序后写出")
+    ap.add_argument("--qix", action="store_true", help="Shapefile 同时写出 .qix 空间索引")
+    ap.add_argument("--fast", action="store_true", help="GCJ-02 / BD-09 反解用预计算偏移表（毫米级误差，会打印实测最大误差）")
+    ap.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="进程数，1 表示串行")
+    args = ap.parse_args(argv)
+
+    src = parse_crs(args.src)
+    dst = parse_crs(args.dst) if args.dst else src
+    opts = {"x": args.x, "y": args.y, "src": src, "dst": dst, "fmt": args.fmt,
+            "out_dir": args.out_dir, "precision": args.precision, "fast": args.fast,
+            "order": args.order, "qix": args.qix,
+            "parallel": args.workers <= 1}  # 已按任务多进程时，分卷不再另开进程
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    jobs, errors = list_jobs(args.patterns, args.sheets)
+    print(f"坐标系：{src} -> {dst}；任务 {len(jobs)} 个；进程 {args.workers}")
+    if args.fast and src in ("GCJ-02", "BD-09"):
+        print("\n".join(fast_mode_report()))
+    t0 = time.perf_counter()
+    results = []
+    if args.workers <= 1:
+        for path, sheet in jobs:
+            results.append(run_job((path, sheet, opts)))
+            print(f"完成 {len(results)}/{len(jobs)}：{path} / {sheet}")
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as ex:
+            futs = [ex.submit(run_job, (path, sheet, opts)) for path, sheet in jobs]
+            for fut in as_completed(futs):
+                r = fut.result()
+                results.append(r)
+                print(f"完成 {len(results)}/{len(jobs)}：{r['file']} / {r['sheet']}")
+    results.sort(key=lambda r: (r["file"], r["sheet"]))
+    print_summary(results, errors, time.perf_counter() - t0)
+    return 1 if errors or any(r["error"] for r in results) else 0
+
+if __name__ == "__main__":
+    freeze_support()  # 打包后的 EXE 中多进程的子进程从这里进入
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+性能基准：生成中国境内的合成点数据（Excel + CSV），分别计时各处理阶段，结果写成 JSON，
+可用 --compare 与上一次的结果对比，找出变慢的阶段。
+
+示例：
+    python bench.py --sizes 10k,100k --out bench_results.json
+    python bench.py --sizes 10k,100k,1m --compare bench_results.json
+    python bench.py --sizes 10m --stages csv_read,transform,gcj02_to_wgs84   # 超过 Excel 行数上限只生成 CSV
+"""
+import os, sys, json, time, platform, argparse, tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import openpyxl
+
+from app_tk import (PRESETS, make_proj_transform, gcj02_to_wgs84, gcj02_to_wgs84_np,
+                    gcj02_to_wgs84_fast, solve_gcj02_inverse, transform_columns,
+                    default_workers, write_output)
+from excel_to_vector_tk import CHUNK_SIZE, read_excel_preview, write_shapefile, write_geojson
+from workbook_session import open_rows, iter_table_frames
+
+EXCEL_MAX_ROWS = 1_048_575  # xlsx 单表最大数据行数（不含表头）
+SCALAR_SAMPLE = 20_000      # 标量版 gcj02_to_wgs84 只抽样计时，再按行数折算
+SHEET = "data"
+
+# 主要城市中心（WGS84）：点按城市聚集分布，更接近真实业务数据
+CITIES = [
+    (116.40, 39.90), (121.47, 31.23), (113.26, 23.13), (114.06, 22.54), (104.07, 30.67),
+    (114.31, 30.59), (108.94, 34.34), (120.15, 30.28), (118.80, 32.06), (126.63, 45.75),
+    (87.62, 43.83), (91.13, 29.65), (102.71, 25.04), (117.20, 39.08), (106.55, 29.56),
+]
+NAMES = ["便利店", "超市", "药店", "餐厅", "加油站", "银行网点", "快递驿站", "学校"]
+
+STAGES = ["excel_read", "read_excel_preview", "csv_read", "transform", "gcj02_to_wgs84", "transform_parallel",
+          "write_shapefile", "write_geojson", "to_excel", "write_output_xlsx"]
+
+def parse_size(text):
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * mult)
+
+def make_frame(n, seed=0):
+    """n 行合成数据：WGS84 经纬度（城市聚集 + 少量全国均匀分布）与混合类型属性列"""
+    rng = np.random.default_rng(seed)
+    city = rng.integers(0, len(CITIES), n)
+    centers = np.array(CITIES)[city]
+    lon = centers[:, 0] + rng.normal(0, 0.15, n)
+    lat = centers[:, 1] + rng.normal(0, 0.12, n)
+    spread = rng.random(n) < 0.05
+    lon[spread] = rng.uniform(75, 134, spread.sum())
+    lat[spread] = rng.uniform(18, 53, spread.sum())
+    value = np.round(rng.gamma(2.0, 150.0, n), 2)
+    value[rng.random(n) < 0.03] = np.nan
+    base = datetime(2020, 1, 1)
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "名称": [f"{NAMES[k % len(NAMES)]}{k}" for k in rng.integers(0, 5000, n)],
+        "lon": np.round(lon, 7),
+        "lat": np.round(lat, 7),
+        "销售额": value,
+        "营业": rng.random(n) < 0.9,
+        "开业日期": [base + timedelta(days=int(d)) for d in rng.integers(0, 1800, n)],
+    })
+
+def write_xlsx_fast(df, path):
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET)
+    ws.append(list(df.columns))
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(path)
+
+def ensure_data(n, data_dir, log):
+    """生成（或复用已有的）合成数据文件，返回 (xlsx 路径或 None, csv 路径, DataFrame)"""
+    os.makedirs(data_dir, exist_ok=True)
+    df = make_frame(n)
+    csv_path = os.path.join(data_dir, f"points_{n}.csv")
+    xlsx_path = os.path.join(data_dir, f"points_{n}.xlsx") if n <= EXCEL_MAX_ROWS else None
+    if not os.path.exists(csv_path):
+        log(f"生成 {csv_path}")
+        df.to_csv(csv_path, index=False, encoding="utf-8")
+    if xlsx_path and not os.path.exists(xlsx_path):
+        log(f"生成 {xlsx_path}")
+        write_xlsx_fast(df, xlsx_path)
+    return xlsx_path, csv_path, df
+
+def best_of(fn, repeat):
+    """重复 repeat 次取最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_size(n, data_dir, stages, repeat, log):
+    xlsx_path, csv_path, df = ensure_data(n, data_dir, log)
+    results = []
+
+    def record(stage, seconds, rows=n, **extra):
+        res = {"size": n, "stage": stage, "seconds": round(seconds, 6),
+               "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None}
+        res.update(extra)
+        results.append(res)
+        log(f"  {stage:<40} {seconds:10.4f}s  {res['rows_per_sec'] or 0:>14,.0f} 行/秒")
+
+    if "excel_read" in stages and xlsx_path:
+        record("excel_read", best_of(lambda: sum(1 for _ in open_rows(xlsx_path, SHEET)), repeat))
+    if "read_excel_preview" in stages and xlsx_path:
+        record("read_excel_preview", best_of(lambda: read_excel_preview(xlsx_path, SHEET), repeat), rows=200)
+    if "csv_read" in stages:
+        record("csv_read", best_of(lambda: sum(len(f) for f in iter_table_frames(csv_path)), repeat))
+
+    lon = df["lon"].to_numpy(dtype=np.float64)
+    lat = df["lat"].to_numpy(dtype=np.float64)
+    if "transform" in stages:
+        for _, src in PRESETS:
+            # 先把 WGS84 样本转到输入坐标系（不计时），再计时 src → dst
+            sx, sy = make_proj_transform("EPSG:4326", src)(lon, lat)
+            for _, dst in PRESETS:
+                if src == dst:
+                    continue
+                f = make_proj_transform(src, dst)
+                record(f"transform:{src}->{dst}", best_of(lambda: f(sx, sy), repeat))
+
+    if "gcj02_to_wgs84" in stages:
+        gx, gy = make_proj_transform("EPSG:4326", "GCJ-02")(lon, lat)
+        _, _, max_err, n_iter = solve_gcj02_inverse(gx, gy)
+        record("gcj02_to_wgs84_np", best_of(lambda: gcj02_to_wgs84_np(gx, gy), repeat),
+               max_err=max_err, iterations=n_iter)
+        m = min(n, SCALAR_SAMPLE)
+        sx, sy = gx[:m].tolist(), gy[:m].tolist()
+        t = best_of(lambda: [gcj02_to_wgs84(a, b) for a, b in zip(sx, sy)], repeat)
+        record("gcj02_to_wgs84_scalar", t * n / m, sampled_rows=m)
+        flon, flat = gcj02_to_wgs84_fast(gx, gy)
+        wlon, wlat, _, _ = solve_gcj02_inverse(gx, gy, tol=1e-12, max_iter=50)
+        record("gcj02_to_wgs84_fast", best_of(lambda: gcj02_to_wgs84_fast(gx, gy), repeat),
+               max_err=float(max(np.abs(flon - wlon).max(), np.abs(flat - wlat).max())))
+
+    if "transform_parallel" in stages:
+        # 多进程转换（行数少于 PARALLEL_MIN_ROWS 时自动退回串行）；先跑一次预热进程池
+        gx, gy = make_proj_transform("EPSG:4326", "GCJ-02")(lon, lat)
+        f = make_proj_transform("GCJ-02", "EPSG:4326")
+        workers = default_workers()
+        transform_columns(f, gx, gy, workers=workers)
+        record("transform_parallel:GCJ-02->EPSG:4326",
+               best_of(lambda: transform_columns(f, gx, gy, workers=workers), repeat), workers=workers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        headers = list(df.columns)
+        x_idx, y_idx = headers.index("lon"), headers.index("lat")
+        # 每次重复都给一个新的逐块生成器：10m 行时整表的行元组会占好几 GB
+        if "write_shapefile" in stages:
+            record("write_shapefile", best_of(
+                lambda: write_shapefile(os.path.join(tmp, "b.shp"), _rows(df), headers, x_idx, y_idx, "4326"), repeat))
+        if "write_geojson" in stages:
+            record("write_geojson", best_of(
+                lambda: write_geojson(os.path.join(tmp, "b.geojson"), _rows(df), headers, x_idx, y_idx, "4326"), repeat))
+        if "to_excel" in stages and n <= EXCEL_MAX_ROWS:
+            record("to_excel", best_of(lambda: df.to_excel(os.path.join(tmp, "b.xlsx"), index=False), repeat))
+        if "write_output_xlsx" in stages and n <= EXCEL_MAX_ROWS:
+            record("write_output_xlsx", best_of(lambda: write_output(df, os.path.join(tmp, "c.xlsx")), repeat))
+    return results
+
+def _rows(df, chunk_size=CHUNK_SIZE):
+    """逐块把 DataFrame 转为行元组（NaN → None），与读取阶段一样流式产出，不在内存中保留全部行"""
+    for start in range(0, len(df), chunk_size):
+        part = df.iloc[start:start + chunk_size]
+        yield from part.astype(object).where(part.notna(), None).itertuples(index=False, name=None)
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        return {(r["size"], r["stage"]): r["seconds"] for r in json.load(f)["results"]}
+
+def compare(results, base, threshold):
+    """与基线对比，返回变慢超过 threshold（比例）的条目"""
+    slower = []
+    print("\n==== 与基线对比 ====")
+    for r in results:
+        old = base.get((r["size"], r["stage"]))
+        if not old:
+            continue
+        ratio = r["seconds"] / old
+        mark = "  ← 变慢" if ratio > 1 + threshold else ""
+        print(f"{r['size']:>10,} {r['stage']:<40} {old:10.4f}s → {r['seconds']:10.4f}s  ×{ratio:.2f}{mark}")
+        if mark:
+            slower.append(r)
+    return slower
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="各处理阶段的性能基准")
+    ap.add_argument("--sizes", default="10k,100k", help="点数，逗号分隔，如 10k,100k,1m,10m")
+    ap.add_argument("--stages", default=",".join(STAGES), help=f"要计时的阶段，默认全部：{','.join(STAGES)}")
+    ap.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数，取最短耗时")
+    ap.add_argument("--data-dir", default="bench_data", help="合成数据目录（已存在的文件会复用）")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="基线结果 JSON，对比并列出变慢的阶段")
+    ap.add_argument("--threshold", type=float, default=0.2, help="判定为变慢的比例，默认 0.2（慢 20%%）")
+    args = ap.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    stages = {s.strip() for s in args.stages.split(",") if s.strip()}
+    unknown = stages - set(STAGES)
+    if unknown:
+        ap.error(f"未知阶段：{sorted(unknown)}")
+    # 先读基线，--out 与 --compare 可以是同一个文件
+    baseline = load_baseline(args.compare) if args.compare else None
+
+    results = []
+    for n in sizes:
+        print(f"==== {n:,} 点 ====")
+        results += bench_size(n, args.data_dir, stages, args.repeat, print)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__, "openpyxl": openpyxl.__version__,
+            "sizes": sizes, "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入：{args.out}")
+
+    if baseline is not None:
+        slower = compare(results, baseline, args.threshold)
+        return 1 if slower else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import numbers
+from array import array
+import numpy as np
+
+STORE_CHUNK = 5000  # 按块还原行时的块大小
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+FLOAT_EXACT_INT = 1 << 53  # 绝对值不超过它的整数存成 float64 不丢精度
+_NAN = float("nan")  # 字典编码里所有 NaN 归为同一个对象（NaN != NaN，否则每个都会新建一项）
+
+class _Column:
+    """
+    单个属性列：整数存 array('q')，小数存 array('d')，其余（文本、日期、布尔、混合类型）
+    按字典编码为 array('i') 代码 + 取值表。空值记在按需创建的 bytearray 里（每行 1 字节）。
+    类型按首个非空值确定。整数列遇到小数时放宽为 array('d')，另用按需创建的 is_int 掩码
+    记下哪些行原本是整数（openpyxl 对整数值的单元格返回 int，小数列常是整数与小数混排）；
+    只有遇到非数值（或超出 float64 精确范围的整数）时才整列转为字典编码，保证还原出的值与原值一致
+    """
+    def __init__(self):
+        self.kind = None       # None（尚未见到非空值）/ "int" / "float" / "dict"
+        self.data = None
+        self.nulls = None
+        self.is_int = None     # float 列中原为整数的行（每行 1 字节，按需创建）
+        self.n = 0
+        self.values = None     # 字典编码的取值表
+        self.codes = None      # (类型, 取值) → 代码；带上类型，1 / 1.0 / True 不会合并
+
+    def _null(self):
+        if self.nulls is None:
+            self.nulls = bytearray(self.n)
+        self.nulls.append(1)
+
+    def _set_kind(self, kind):
+        self.kind = kind
+        lead = self.n  # 此前全是空值
+        if kind == "dict":
+            self.values, self.codes = [None], {(type(None), None): 0}
+            self.data = array("i", bytes(4 * lead))
+            self.nulls = None
+            self.is_int = None
+        else:
+            self.data = array("q" if kind == "int" else "d", bytes(8 * lead))
+            self.nulls = bytearray(b"\x01" * lead) if lead else None
+
+    def _int_to_float(self):
+        """整数列放宽为小数列；超出 float64 精确范围时返回 False"""
+        ints = np.frombuffer(self.data, dtype=np.int64)
+        if len(ints) and np.abs(ints).max() > FLOAT_EXACT_INT:
+            return False
+        self.data = array("d", ints.astype(np.float64).tobytes())
+        self.is_int = bytearray(b"\x01" * self.n)
+        self.kind = "float"
+        return True
+
+    def _to_dict(self):
+        """整列改为字典编码（出现与当前类型不符的值时）"""
+        old = self.get_range(0, self.n)
+        self.n = 0
+        self._set_kind("dict")
+        for v in old:
+            self.append(v)
+
+    def append(self, v):
+        if self.kind is None:
+            if v is None:
+                self.n += 1
+                return
+            if isinstance(v, numbers.Integral) and not isinstance(v, bool) and INT64_MIN <= v <= INT64_MAX:
+                self._set_kind("int")
+            elif isinstance(v, float):
+                self._set_kind("float")
+            else:
+                self._set_kind("dict")
+        kind = self.kind
+        if kind == "dict":
+            if isinstance(v, (list, dict, tuple, set)):
+                v = str(v)
+            elif isinstance(v, float) and v != v:
+                v = _NAN
+            key = (v.__class__, v)
+            code = self.codes.get(key)
+            if code is None:
+                code = self.codes[key] = len(self.values)
+                self.values.append(v)
+            self.data.append(code)
+        elif v is None:
+            self.data.append(0)
+            self._null()
+            if self.is_int is not None:
+                self.is_int.append(0)
+        elif kind == "int" and isinstance(v, numbers.Integral) and not isinstance(v, bool) \
+                and INT64_MIN <= v <= INT64_MAX:
+            self.data.append(int(v))
+            if self.nulls is not None:
+                self.nulls.append(0)
+        elif kind == "float" and isinstance(v, float):
+            self.data.append(v)
+            if self.nulls is not None:
+                self.nulls.append(0)
+            if self.is_int is not None:
+                self.is_int.append(0)
+        elif kind == "float" and isinstance(v, numbers.Integral) and not isinstance(v, bool) \
+                and abs(v) <= FLOAT_EXACT_INT:
+            if self.is_int is None:
+                self.is_int = bytearray(self.n)
+            self.data.append(float(v))
+            self.is_int.append(1)
+            if self.nulls is not None:
+                self.nulls.append(0)
+        else:
+            if not (kind == "int" and isinstance(v, float) and self._int_to_float()):
+                self._to_dict()
+            self.append(v)
+            return
+        self.n += 1
+
+    def get_range(self, start, stop):
+        if self.kind is None:
+            return [None] * (stop - start)
+        if self.kind == "dict":
+            values = self.values
+            return [values[c] for c in self.data[start:stop]]
+        out = self.data[start:stop].tolist()
+        if self.is_int is not None:
+            for k, flag in enumerate(self.is_int[start:stop]):
+                if flag:
+                    out[k] = int(out[k])
+        if self.nulls is not None:
+            for k, flag in enumerate(self.nulls[start:stop]):
+                if flag:
+                    out[k] = None
+        return out
+
+    def reorder(self, idx):
+        if self.kind is None:
+            return
+        buf = np.frombuffer(self.data, dtype=self.data.typecode)[idx]
+        self.data = array(self.data.typecode, buf.tobytes())
+        if self.nulls is not None:
+            self.nulls = bytearray(np.frombuffer(self.nulls, dtype=np.uint8)[idx].tobytes())
+        if self.is_int is not None:
+            self.is_int = bytearray(np.frombuffer(self.is_int, dtype=np.uint8)[idx].tobytes())
+
+    def nbytes(self):
+        n = 0 if self.data is None else len(self.data) * self.data.itemsize
+        return n + sum(len(m) for m in (self.nulls, self.is_int) if m is not None)
+
+class ColumnStore:
+    """
+    导出用的列式点存储：X/Y 为 array('d')，各属性列见 _Column。
+    与逐行保存 (x, y, 行元组) 相比，每行只占十几到几十字节（重复的文本只存一份），
+    适合需要把全部点留在内存里的场景（如按空间填充曲线排序后写出）。
+    迭代产出 (x, y, row)，row 为按原列位置还原的行列表，写出函数可直接使用
+    """
+    def __init__(self, headers, x_idx, y_idx):
+        self.width = len(headers)
+        self.x_idx, self.y_idx = x_idx, y_idx
+        self.attr_indices = [i for i in range(self.width) if i not in (x_idx, y_idx)]
+        self.xs, self.ys = array("d"), array("d")
+        self.columns = [_Column() for _ in self.attr_indices]
+
+    def __len__(self):
+        return len(self.xs)
+
+    def extend(self, points):
+        """追加 (x, y, row)（如 iter_points 的输出）"""
+        xs, ys = self.xs, self.ys
+        pairs = list(zip(self.attr_indices, self.columns))
+        for x, y, r in points:
+            xs.append(x); ys.append(y)
+            n = len(r)
+            for i, col in pairs:
+                col.append(r[i] if i < n else None)
+        return self
+
+    def reorder(self, idx):
+        """按下标数组 idx 重排全部列（如 curve_order 的结果）"""
+        idx = np.asarray(idx, dtype=np.intp)
+        self.xs = array("d", np.frombuffer(self.xs, dtype=np.float64)[idx].tobytes())
+        self.ys = array("d", np.frombuffer(self.ys, dtype=np.float64)[idx].tobytes())
+        for col in self.columns:
+            col.reorder(idx)
+        return self
+
+    def points(self, start=0, stop=None):
+        """还原 [start, stop) 行为 [(x, y, row)] 列表"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if stop <= start:
+            return []
+        n = stop - start
+        rows = [[None] * self.width for _ in range(n)]
+        for i, col in zip(self.attr_indices, self.columns):
+            for row, v in zip(rows, col.get_range(start, stop)):
+                row[i] = v
+        xs, ys = self.xs[start:stop].tolist(), self.ys[start:stop].tolist()
+        x_idx, y_idx = self.x_idx, self.y_idx
+        for row, x, y in zip(rows, xs, ys):
+            row[x_idx], row[y_idx] = x, y
+        return list(zip(xs, ys, rows))
+
+    def __iter__(self):
+        for start in range(0, len(self), STORE_CHUNK):
+            yield from self.points(start, start + STORE_CHUNK)
+
+    def rows(self):
+        """按行产出（X/Y 已写回原列位置），可作为各写出函数的 rows 输入"""
+        for _, _, row in self:
+            yield row
+
+    def nbytes(self):
+        """列缓冲区占用的字节数（不含字典取值表本身）"""
+        return 16 * len(self) + sum(col.nbytes() for col in self.columns)
@@ -1,4 +1,9 @@
-import os, json
+import os, json, math, time, glob, queue, pickle, struct, sqlite3, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager, freeze_support
+from array import array
+from datetime import date, datetime
+from itertools import chain, islice
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
@@ -7,13 +12,22 @@ import openpyxl
 import shapefile  # 来自 pyshp 包
 from pyproj import CRS
 
+from app_tk import PRESETS, make_proj_transform, resolve_crs
+from column_store import ColumnStore
+from instrument import StageProfiler, profile_path, trace_memory_requested
+from spatial_index import CURVES, curve_order, write_qix
+from task_runner import BackgroundTask, TaskCancelled, iter_progress
+from workbook_session import get_session, open_rows, sheet_row_count
+
 # =============== 基础工具 ===============
 
+CHUNK_SIZE = 5000  # 流式管线每块行数：内存占用只与块大小有关，与表的总行数无关
+
 def read_excel_preview(path, sheet=None, max_rows=200):
-    """读取 Excel 的表头与前 max_rows 行，用于预览与列名选择"""
+    """读取 Excel 的表头与前 max_rows 行，用于预览与列名选择（只读取这些行，不扫描整表）"""
     wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
     sh = wb[sheet] if sheet else wb[wb.sheetnames[0]]
-    rows = list(sh.iter_rows(values_only=True))
+    rows = list(sh.iter_rows(max_row=max_rows + 1, values_only=True))
     if not rows:
         wb.close()
         raise ValueError("Excel 文件为空")
@@ -22,6 +36,73 @@ def read_excel_preview(path, sheet=None, max_rows=200):
     wb.close()
     return wb.sheetnames, headers, data
 
+def iter_chunks(rows, size=CHUNK_SIZE):
+    """把任意行迭代器切成不超过 size 行的列表块"""
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+class RowSpool:
+    """
+    行暂存：tee() 透传行的同时按块 pickle 到临时文件，replay() 按原顺序回放。
+    用于需要两遍读取的导出（先扫描字段再写出），源文件只解析一次；临时文件在 close() 时删除
+    """
+    def __init__(self, dir=None):
+        self.f = tempfile.TemporaryFile(prefix="arope_spool_", dir=dir)
+
+    def tee(self, rows, chunk_size=CHUNK_SIZE):
+        for chunk in iter_chunks(rows, chunk_size):
+            pickle.dump(chunk, self.f, protocol=pickle.HIGHEST_PROTOCOL)
+            yield from chunk
+
+    def replay(self):
+        self.f.flush()
+        self.f.seek(0)
+        while True:
+            try:
+                chunk = pickle.load(self.f)
+            except EOFError:
+                return
+            yield from chunk
+
+    def close(self):
+        self.f.close()
+
+def iter_points(rows, x_idx, y_idx):
+    """解析 X/Y，逐行产出 (x, y, row)；X/Y 无法转为数值的行跳过"""
+    for r in rows:
+        x = try_float(r[x_idx] if x_idx < len(r) else None)
+        y = try_float(r[y_idx] if y_idx < len(r) else None)
+        if x is None or y is None:
+            continue
+        yield x, y, r
+
+def reproject_rows(rows, x_idx, y_idx, transform, chunk_size=CHUNK_SIZE):
+    """
+    逐块转换 X/Y：transform(xs, ys) 接收整块坐标列表、返回转换后的两列（如 make_proj_transform 的结果）。
+    产出替换了 X/Y 的行；无效或转换失败的坐标置为 None，由写出阶段跳过
+    """
+    for chunk in iter_chunks(rows, chunk_size):
+        idx, xs, ys = [], [], []
+        for k, r in enumerate(chunk):
+            x = try_float(r[x_idx] if x_idx < len(r) else None)
+            y = try_float(r[y_idx] if y_idx < len(r) else None)
+            if x is None or y is None:
+                continue
+            idx.append(k); xs.append(x); ys.append(y)
+        if idx:
+            ox, oy = transform(xs, ys)
+            for k, xv, yv in zip(idx, ox, oy):
+                xv, yv = float(xv), float(yv)
+                ok = math.isfinite(xv) and math.isfinite(yv)
+                r = list(chunk[k])
+                r[x_idx], r[y_idx] = (xv, yv) if ok else (None, None)
+                chunk[k] = r
+        yield from chunk
+
 def try_float(v):
     try:
         if v is None or v == "":
@@ -30,99 +111,669 @@ def try_float(v):
     except:
         return None
 
-def infer_field_type(values, max_len=50):
-    """非常简单的字段类型推断：全数值→F；全文本→C；混合→C"""
-    has_text = False
-    has_float = False
-    for v in values[:200]:
-        if v is None:
-            continue
-        if isinstance(v, (int, float)):
-            has_float = True
-        else:
-            has_text = True
-    if has_text and not has_float:
-        return "C", max_len       # 文本
-    if has_float and not has_text:
-        return "F", 18            # 数值
-    return "C", max_len           # 混合→文本
-
-def write_shapefile(out_path, rows, headers, x_idx, y_idx, crs_epsg):
+DBF_MAX_C = 254     # DBF 文本字段最大字节数
+DBF_MAX_NUM = 20    # DBF 数值字段最大宽度
+DBF_MAX_DEC = 15    # 浮点字段最大小数位
+
+def non_finite(v):
+    """inf / -inf / NaN：DBF 数值字段与 GeoJSON 都无法表示，推断与写出时一律按空值处理"""
+    return isinstance(v, float) and not math.isfinite(v)
+
+def _float_decimals(v):
+    """浮点数最短往返表示所需的小数位数"""
+    t = repr(abs(v))
+    if "e" in t:
+        mant, exp = t.split("e")
+        frac = len(mant.split(".")[1]) if "." in mant else 0
+        return max(0, frac - int(exp))
+    return len(t.split(".")[1]) if "." in t else 0
+
+class SchemaInferer:
+    """
+    单遍流式推断 DBF 字段：逐块 update()，每列只扫描一次。
+    类型：N（整数）/ F（小数）/ D（日期）/ L（布尔）/ C（文本或混合），
+    并记录文本的 UTF-8 最大字节数、数值的整数位宽与小数位数
+    """
+    def __init__(self, headers, x_idx, y_idx):
+        self.headers = headers
+        self.x_idx, self.y_idx = x_idx, y_idx
+        self.attr_indices = [i for i in range(len(headers)) if i not in (x_idx, y_idx)]
+        n = len(self.attr_indices)
+        self.kinds = [set() for _ in range(n)]
+        self.count = 0            # 有效点数（X/Y 可解析的行）
+        self.text_len = [1] * n   # 按文本写出时的最大字节数
+        self.int_width = [1] * n  # 整数部分宽度（含负号）
+        self.decimals = [0] * n
+
+    def update(self, rows):
+        for _, _, r in iter_points(rows, self.x_idx, self.y_idx):
+            self.count += 1
+            for j, i in enumerate(self.attr_indices):
+                v = r[i] if i < len(r) else None
+                if v is None or v == "" or non_finite(v):
+                    continue
+                kinds = self.kinds[j]
+                if isinstance(v, bool):
+                    kinds.add("L")
+                    t = str(v)
+                elif isinstance(v, int) or (isinstance(v, float) and v.is_integer()):
+                    kinds.add("N")
+                    t = str(int(v))
+                    self.int_width[j] = max(self.int_width[j], len(t))
+                elif isinstance(v, float):
+                    kinds.add("F")
+                    t = repr(v)
+                    self.int_width[j] = max(self.int_width[j], len(str(int(v))) + (v < 0 and int(v) == 0))
+                    self.decimals[j] = max(self.decimals[j], _float_decimals(v))
+                elif isinstance(v, datetime):
+                    kinds.add("D" if v.time() == datetime.min.time() else "C")
+                    t = str(v)
+                elif isinstance(v, date):
+                    kinds.add("D")
+                    t = str(v)
+                else:
+                    kinds.add("C")
+                    t = str(v)
+                n = len(t.encode("utf-8"))
+                if n > self.text_len[j]:
+                    self.text_len[j] = n
+
+    def sql_types(self):
+        """GeoPackage 字段：[(列名, SQL 类型)]，与 attr_indices 一一对应；列名不截断"""
+        out = []
+        for j, i in enumerate(self.attr_indices):
+            kinds = self.kinds[j]
+            if kinds == {"L"}:
+                t = "BOOLEAN"
+            elif kinds == {"D"}:
+                t = "DATE"
+            elif kinds == {"N"}:
+                t = "INTEGER" if self.int_width[j] <= 19 else "TEXT"  # SQLite 整数为 64 位
+            elif kinds and kinds <= {"N", "F"}:
+                t = "REAL"
+            else:
+                t = "TEXT"
+            out.append((self.headers[i] or f"F{i}", t))
+        return out
+
+    def fields(self):
+        """返回 [(字段名, 类型, 宽度, 小数位)]，与 attr_indices 一一对应；SHP 字段名≤10字符"""
+        out = []
+        for j, i in enumerate(self.attr_indices):
+            name = (self.headers[i] or f"F{i}")[:10]
+            kinds = self.kinds[j]
+            text = ("C", min(self.text_len[j], DBF_MAX_C), 0)
+            if kinds == {"L"}:
+                spec = ("L", 1, 0)
+            elif kinds == {"D"}:
+                spec = ("D", 8, 0)
+            elif kinds == {"N"}:
+                spec = ("N", self.int_width[j], 0) if self.int_width[j] <= DBF_MAX_NUM else text
+            elif kinds and kinds <= {"N", "F"}:
+                iw = self.int_width[j]
+                dec = min(self.decimals[j], DBF_MAX_DEC, DBF_MAX_NUM - iw - 1)
+                spec = ("F", iw + 1 + dec, dec) if dec >= 0 else text
+            else:
+                spec = text
+            out.append((name,) + spec)
+        return out
+
+def scan_schema(rows, headers, x_idx, y_idx, chunk_size=CHUNK_SIZE):
+    """流式扫描全部数据行，返回 SchemaInferer"""
+    inferer = SchemaInferer(headers, x_idx, y_idx)
+    for chunk in iter_chunks(rows, chunk_size):
+        inferer.update(chunk)
+    return inferer
+
+def infer_schema(rows, headers, x_idx, y_idx, chunk_size=CHUNK_SIZE):
+    """流式扫描全部数据行，返回 SchemaInferer.fields() 的字段定义"""
+    return scan_schema(rows, headers, x_idx, y_idx, chunk_size).fields()
+
+SHP_MAX_BYTES = 2**31 - 1  # .shp / .dbf 单文件上限：多数软件按有符号 32 位偏移读取，超过即损坏
+SHP_POINT_RECORD = 28      # .shp 点记录：8 字节记录头 + 20 字节内容
+SHP_PART_EXT = (".shp", ".shx", ".dbf", ".prj", ".cpg", ".qix")
+PART_QUEUE = 4             # 并行写分卷时每个分卷最多排队的块数
+
+def max_part_rows(schema, max_bytes=SHP_MAX_BYTES):
+    """按字段宽度估算单个分卷最多容纳的要素数（.dbf 与 .shp 都不超过 max_bytes）"""
+    dbf_header = 32 + 32 * len(schema) + 1
+    dbf_record = 1 + sum(size for _, _, size, _ in schema)
+    return max(1, min((max_bytes - dbf_header) // dbf_record, (max_bytes - 100) // SHP_POINT_RECORD))
+
+def part_path(out_path, k):
+    base, ext = os.path.splitext(out_path)
+    return f"{base}_part{k}{ext}"
+
+def manifest_path(out_path):
+    return os.path.splitext(out_path)[0] + ".parts.json"
+
+class ShpPartWriter:
+    """写单个 Shapefile（或其中一个分卷）：write() 可多次调用，close() 时补齐 .prj/.cpg/.qix"""
+    def __init__(self, path, schema, attr_indices, crs_epsg, qix=False, limit=None):
+        self.path = path
+        self.attr_indices = attr_indices
+        self.crs_epsg = crs_epsg
+        self.qix = qix
+        self.limit = limit
+        self.count = 0
+        self.text_fields = [ftype == "C" for _, ftype, _, _ in schema]
+        self.xs, self.ys = array("d"), array("d")
+        self.w = shapefile.Writer(path, shapeType=shapefile.POINT)
+        for name, ftype, size, decimal in schema:
+            self.w.field(name, ftype, size=size, decimal=decimal)
+
+    def write(self, points):
+        w, attr_indices = self.w, self.attr_indices
+        for x, y, r in points:
+            if self.limit is not None and self.count >= self.limit:
+                raise ValueError(f"{os.path.basename(self.path)} 超过单文件大小上限（数据在两次扫描之间发生了变化？）")
+            if self.qix:
+                self.xs.append(x); self.ys.append(y)
+            w.point(x, y)
+            rec = []
+            for i, is_text in zip(attr_indices, self.text_fields):
+                v = r[i] if i < len(r) else None
+                # DBF 不支持复杂类型，做个字符串化
+                if isinstance(v, (list, dict, tuple, set)):
+                    v = str(v)
+                elif non_finite(v):
+                    v = None
+                # pyshp 会把文本字段里的 None 写成 "None"
+                rec.append("" if v is None and is_text else v)
+            w.record(*rec)
+            self.count += 1
+
+    def close(self):
+        self.w.close()
+        base = os.path.splitext(self.path)[0]
+        # 写 .qix（四叉树空间索引，要素号与写出顺序一致）
+        if self.qix:
+            write_qix(base + ".qix", self.xs, self.ys)
+
+        # 写 .prj（坐标系）
+        crs = CRS.from_user_input(f"EPSG:{self.crs_epsg}")
+        with open(base + ".prj", "w", encoding="utf-8") as f:
+            f.write(crs.to_wkt())
+
+        # 写 .cpg（编码声明，避免中文字段/值乱码）
+        with open(base + ".cpg", "w", encoding="utf-8") as f:
+            f.write("UTF-8")
+
+    def rename(self, path):
+        """已关闭的文件整体改名（单文件写满后转为第 1 个分卷）"""
+        src, dst = os.path.splitext(self.path)[0], os.path.splitext(path)[0]
+        for ext in SHP_PART_EXT:
+            if os.path.exists(src + ext):
+                os.replace(src + ext, dst + ext)
+        self.path = path
+
+def _write_part_worker(path, schema, attr_indices, crs_epsg, qix, limit, q):
+    """进程池中写一个分卷：从队列取点块直到收到 None，返回写出的要素数"""
+    part = ShpPartWriter(path, schema, attr_indices, crs_epsg, qix, limit)
+    try:
+        while True:
+            points = q.get()
+            if points is None:
+                break
+            part.write(points)
+    finally:
+        part.close()
+    return part.count
+
+def _write_parts_serial(out_path, points, new_part, part_rows):
+    """顺序写出：先写 out_path，写满 part_rows 后改名为第 1 个分卷并继续写第 2、3…个"""
+    parts = []
+    cur = new_part(out_path)
+    try:
+        for p in points:
+            if cur.count >= part_rows:
+                cur.close()
+                if not parts:
+                    cur.rename(part_path(out_path, 1))
+                parts.append(cur)
+                cur = new_part(part_path(out_path, len(parts) + 1))
+            cur.write((p,))
+    finally:
+        cur.close()
+    return parts + [cur]
+
+def _write_parts_parallel(out_path, points, args, n_parts, part_rows, chunk_size):
     """
-    写出 ESRI Shapefile（点）。会生成 .shp/.shx/.dbf/.prj/.cpg
-    rows: 数据行（不含表头），headers：表头列表
-    x_idx/y_idx：X/Y 列索引
+    并行写出：每个分卷一个进程，主进程把点块经有界队列分发过去。
+    points 为 ColumnStore（已排序）时各分卷是连续区间，按块交错分发；否则按块轮流分给各分卷
     """
-    w = shapefile.Writer(out_path, shapeType=shapefile.POINT)
+    if isinstance(points, ColumnStore):
+        size = -(-len(points) // n_parts)
+        feed = ((k, points.points(k * size + c, k * size + min(c + chunk_size, size)))
+                for c in range(0, size, chunk_size) for k in range(n_parts))
+    else:
+        feed = ((i % n_parts, chunk) for i, chunk in enumerate(iter_chunks(points, chunk_size)))
+    paths = [part_path(out_path, k + 1) for k in range(n_parts)]
+    with Manager() as mgr, ProcessPoolExecutor(max_workers=n_parts) as ex:
+        queues = [mgr.Queue(PART_QUEUE) for _ in range(n_parts)]
+        futs = [ex.submit(_write_part_worker, paths[k], *args, part_rows, queues[k]) for k in range(n_parts)]
+
+        def put(k, item, check=True):
+            # 写分卷的进程出错退出后队列不再被消费，这里及时把错误抛出来，避免一直阻塞。
+            # 发结束标记时 check=False：不抛其他分卷的错误（否则后面的分卷收不到 None，进程池退出时会一直等），
+            # 只在该分卷进程自己已退出时放弃；原始错误之后由 fut.result() 或正在传播的异常抛出
+            while True:
+                try:
+                    queues[k].put(item, timeout=1)
+                    return
+                except queue.Full:
+                    if not check:
+                        if futs[k].done():
+                            return
+                        continue
+                    for fut in futs:
+                        if fut.done() and fut.exception():
+                            raise fut.exception()
+        try:
+            for k, chunk in feed:
+                if chunk:
+                    put(k, chunk)
+        finally:
+            for k in range(n_parts):
+                if not futs[k].done():
+                    put(k, None, check=False)
+        counts = [fut.result() for fut in futs]
+    return [(p, n) for p, n in zip(paths, counts)]
 
-    # 除 X/Y 外的列都作为属性字段；SHP 字段名≤10字符
+def write_shapefile(out_path, rows, headers, x_idx, y_idx, crs_epsg, chunk_size=CHUNK_SIZE, schema=None,
+                    order=None, qix=False, total=None, max_bytes=SHP_MAX_BYTES, parallel=True):
+    """
+    写出 ESRI Shapefile（点）。会生成 .shp/.shx/.dbf/.prj/.cpg（qix=True 时另有 .qix）
+    rows: 数据行迭代器（不含表头），按 chunk_size 分块流式写入
+    headers：表头列表；x_idx/y_idx：X/Y 列索引
+    schema：infer_schema() 的结果；未提供时只按第一块推断
+    order："hilbert" / "zorder" 时按空间填充曲线排序后写出，相邻要素在空间上也相邻；
+           排序需要把全部有效点读入内存（列式存储，见 ColumnStore），不再是流式写出
+    qix：写出 .qix 四叉树空间索引（MapServer / GDAL / QGIS 可直接使用）
+    分卷：按字段宽度估算记录大小，.shp/.dbf 会超过 max_bytes 时拆成 <名称>_part1.shp、_part2.shp…，
+          每个分卷自带 .prj/.cpg（及 .qix），并写出 <名称>.parts.json 清单。
+          已知有效点数 total（或已排序）且 parallel=True 时各分卷由独立进程同时写出；
+          流式输入下各分卷按 chunk_size 块轮流分配，排序后的输入则各分卷为连续区间
+    返回写出的要素总数
+    """
+    if order is not None and order not in CURVES:
+        raise ValueError(f"不支持的排序方式：{order}")
+    # 清掉同名输出上一次留下的分卷与清单
+    old_manifest = manifest_path(out_path)
+    if os.path.exists(old_manifest):
+        with open(old_manifest, encoding="utf-8") as f:
+            old_parts = [os.path.join(os.path.dirname(out_path), p["file"]) for p in json.load(f)["parts"]]
+        for p in old_parts:
+            for ext in SHP_PART_EXT:
+                if os.path.exists(os.path.splitext(p)[0] + ext):
+                    os.remove(os.path.splitext(p)[0] + ext)
+        os.remove(old_manifest)
+
+    chunks = iter_chunks(rows, chunk_size)
+    first = next(chunks, [])
+
+    # 除 X/Y 外的列都作为属性字段
     attr_indices = [i for i in range(len(headers)) if i not in (x_idx, y_idx)]
-    for i in attr_indices:
-        name = (headers[i] or f"F{i}")[:10]
-        col_vals = [r[i] if i is not None and i < len(r) else None for r in rows]
-        ftype, flen = infer_field_type(col_vals)
-        if ftype == "C":
-            w.field(name, "C", size=flen)
-        else:
-            w.field(name, "F", size=18, decimal=6)
+    if schema is None:
+        inferer = SchemaInferer(headers, x_idx, y_idx)
+        inferer.update(first)
+        schema = inferer.fields()
 
-    count = 0
-    for r in rows:
-        x = try_float(r[x_idx] if x_idx < len(r) else None)
-        y = try_float(r[y_idx] if y_idx < len(r) else None)
-        if x is None or y is None:
-            continue
-        w.point(x, y)
-        rec = []
-        for i in attr_indices:
+    points = (p for chunk in chain([first], chunks) for p in iter_points(chunk, x_idx, y_idx))
+    if order:
+        points = ColumnStore(headers, x_idx, y_idx).extend(points)
+        points.reorder(curve_order(points.xs, points.ys, order))
+        total = len(points)
+
+    part_rows = max_part_rows(schema, max_bytes)
+    chunk_size = min(chunk_size, part_rows)
+    n_parts = 1
+    if total is not None and total > part_rows:
+        # 轮流分块时各分卷行数最多相差一块，分卷数要留出余量
+        n_chunks = -(-total // chunk_size)
+        n_parts = -(-total // part_rows)
+        while not isinstance(points, ColumnStore) and -(-n_chunks // n_parts) * chunk_size > part_rows:
+            n_parts += 1
+
+    args = (schema, attr_indices, crs_epsg, qix)
+    if parallel and n_parts > 1:
+        parts = _write_parts_parallel(out_path, points, args, n_parts, part_rows, chunk_size)
+    else:
+        parts = [(p.path, p.count) for p in _write_parts_serial(
+            out_path, points, lambda path: ShpPartWriter(path, *args, limit=part_rows), part_rows)]
+
+    count = sum(n for _, n in parts)
+    if len(parts) > 1:
+        manifest = {
+            "format": "ESRI Shapefile",
+            "crs": f"EPSG:{crs_epsg}",
+            "total_features": count,
+            "max_bytes_per_file": max_bytes,
+            "parts": [{"file": os.path.basename(p), "features": n} for p, n in parts],
+        }
+        with open(manifest_path(out_path), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return count
+
+FORMAT_EXT = {"shp": ".shp", "geojson": ".geojson", "geojsonseq": ".geojsons", "gpkg": ".gpkg"}
+WRITE_BUFFER = 1 << 20  # GeoJSON 写缓冲 1 MB
+
+def iter_feature_json(rows, headers, x_idx, y_idx, precision=None):
+    """逐个产出点要素的 JSON 文本（不含分隔符）；precision 为坐标保留的小数位，None 表示不取整"""
+    attrs = [(i, json.dumps(h or f"F{i}", ensure_ascii=False))
+             for i, h in enumerate(headers) if i not in (x_idx, y_idx)]
+    for x, y, r in iter_points(rows, x_idx, y_idx):
+        if precision is not None:
+            x, y = round(x, precision), round(y, precision)
+        props = []
+        for i, key in attrs:
             v = r[i] if i < len(r) else None
-            # DBF 不支持复杂类型，做个字符串化
             if isinstance(v, (list, dict, tuple, set)):
                 v = str(v)
-            rec.append(v)
-        w.record(*rec)
-        count += 1
-    w.close()
+            elif non_finite(v):
+                v = None  # json.dumps 会写出不合法的 Infinity / NaN
+            # 日期等非 JSON 类型按字符串写出
+            props.append(f"{key}: {json.dumps(v, ensure_ascii=False, default=str)}")
+        yield ('{"type": "Feature", "geometry": {"type": "Point", "coordinates": [%r, %r]}, '
+               '"properties": {%s}}' % (x, y, ", ".join(props)))
+
+def write_geojson(out_path, rows, headers, x_idx, y_idx, crs_epsg, precision=None, chunk_size=CHUNK_SIZE):
+    """流式写出 GeoJSON（点要素集合）：要素边生成边写入，不在内存中保留整个要素列表"""
+    count = 0
+    with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        for chunk in iter_chunks(rows, chunk_size):
+            feats = list(iter_feature_json(chunk, headers, x_idx, y_idx, precision))
+            if not feats:
+                continue
+            if count:
+                f.write(",\n")
+            f.write(",\n".join(feats))
+            count += len(feats)
+        f.write("\n]}\n")
+    return count
+
+def write_geojsonseq(out_path, rows, headers, x_idx, y_idx, crs_epsg, precision=None, chunk_size=CHUNK_SIZE):
+    """写出 GeoJSON Text Sequence（RFC 8142）：每个要素以 RS(0x1E) 开头、换行结尾"""
+    count = 0
+    with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+        for chunk in iter_chunks(rows, chunk_size):
+            for feat in iter_feature_json(chunk, headers, x_idx, y_idx, precision):
+                f.write("\x1e" + feat + "\n")
+                count += 1
+    return count
+
+# ---------- GeoPackage ----------
+GPKG_BATCH = 50_000  # 每个事务插入的行数
+GPKG_APPLICATION_ID = 0x47504B47  # "GPKG"
+GPKG_USER_VERSION = 10200         # GeoPackage 1.2.0
+# GeoPackage 几何头（"GP"、版本 0、小端且无包围盒、srs_id）+ WKB 点（小端、类型 1、x、y）
+GPKG_POINT = struct.Struct("<2sBBiBIdd")
+
+GPKG_SCHEMA = """
+CREATE TABLE gpkg_spatial_ref_sys (
+    srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+CREATE TABLE gpkg_contents (
+    table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+    description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+    CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id));
+CREATE TABLE gpkg_geometry_columns (
+    table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+    srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+    CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+    CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+    CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id));
+CREATE TABLE gpkg_extensions (
+    table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL, definition TEXT NOT NULL,
+    scope TEXT NOT NULL, CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name));
+"""
+
+# R-tree 同步触发器（GeoPackage 1.2 规范附录；ST_* 函数由读取端如 GDAL 提供）
+GPKG_RTREE_TRIGGERS = """
+CREATE TRIGGER "rtree_{t}_{c}_insert" AFTER INSERT ON "{t}"
+WHEN (new."{c}" NOT NULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."{i}",
+  ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END;
+CREATE TRIGGER "rtree_{t}_{c}_update1" AFTER UPDATE OF "{c}" ON "{t}"
+WHEN OLD."{i}" = NEW."{i}" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."{i}",
+  ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END;
+CREATE TRIGGER "rtree_{t}_{c}_update2" AFTER UPDATE OF "{c}" ON "{t}"
+WHEN OLD."{i}" = NEW."{i}" AND (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}"))
+BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}"; END;
+CREATE TRIGGER "rtree_{t}_{c}_update3" AFTER UPDATE ON "{t}"
+WHEN OLD."{i}" != NEW."{i}" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+  INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."{i}",
+  ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END;
+CREATE TRIGGER "rtree_{t}_{c}_update4" AFTER UPDATE ON "{t}"
+WHEN OLD."{i}" != NEW."{i}" AND (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}"))
+BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id IN (OLD."{i}", NEW."{i}"); END;
+CREATE TRIGGER "rtree_{t}_{c}_delete" AFTER DELETE ON "{t}" WHEN old."{c}" NOT NULL
+BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}"; END;
+"""
+
+def _sql_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _unique_names(names, reserved):
+    """列名去空、去重（不区分大小写），并避开 fid / geom"""
+    seen = {r.lower() for r in reserved}
+    out = []
+    for k, name in enumerate(names):
+        base = name or f"F{k}"
+        name, n = base, 1
+        while name.lower() in seen:
+            n += 1
+            name = f"{base}_{n}"
+        seen.add(name.lower())
+        out.append(name)
+    return out
+
+def _gpkg_value(sql_type):
+    """按列类型把单元格值转换为 SQLite 可存的值"""
+    def conv(v):
+        if v is None or v == "" or non_finite(v):
+            return "" if v == "" and sql_type == "TEXT" else None
+        if sql_type == "BOOLEAN":
+            return int(bool(v))
+        if sql_type == "DATE":
+            return v.isoformat()[:10] if isinstance(v, (date, datetime)) else str(v)
+        if sql_type == "INTEGER":
+            return int(v)
+        if sql_type == "REAL":
+            return float(v)
+        return v if isinstance(v, str) else str(v)
+    return conv
 
-    # 写 .prj（坐标系）
+def write_geopackage(out_path, rows, headers, x_idx, y_idx, crs_epsg, chunk_size=GPKG_BATCH, types=None):
+    """
+    写出 GeoPackage（点图层，仅用标准库 sqlite3）。图层名取文件名，已存在的同名文件会被覆盖。
+    按 chunk_size 分批 executemany，每批一个事务；装载期间关闭日志与同步写盘，
+    装载完成后按 Hilbert 顺序一次性灌入 R-tree 空间索引，再登记扩展与触发器。
+    types：SchemaInferer.sql_types() 的结果；未提供时只按第一块推断
+    """
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    table = os.path.splitext(os.path.basename(out_path))[0]
+    srs_id = int(crs_epsg)
     crs = CRS.from_user_input(f"EPSG:{crs_epsg}")
-    with open(os.path.splitext(out_path)[0] + ".prj", "w", encoding="utf-8") as f:
-        f.write(crs.to_wkt())
+    chunks = iter_chunks(rows, chunk_size)
+    first = next(chunks, [])
+    attr_indices = [i for i in range(len(headers)) if i not in (x_idx, y_idx)]
+    if types is None:
+        inferer = SchemaInferer(headers, x_idx, y_idx)
+        inferer.update(first)
+        types = inferer.sql_types()
+    names = _unique_names([n for n, _ in types], ("fid", "geom"))
+    convs = [_gpkg_value(t) for _, t in types]
 
-    # 写 .cpg（编码声明，避免中文字段/值乱码）
-    with open(os.path.splitext(out_path)[0] + ".cpg", "w", encoding="utf-8") as f:
-        f.write("UTF-8")
+    con = sqlite3.connect(out_path, isolation_level=None)
+    try:
+        con.execute(f"PRAGMA application_id = {GPKG_APPLICATION_ID}")
+        con.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+        for pragma in ("journal_mode = OFF", "synchronous = OFF", "locking_mode = EXCLUSIVE",
+                       "temp_store = MEMORY", "cache_size = -65536"):
+            con.execute("PRAGMA " + pragma)
+        con.executescript(GPKG_SCHEMA)
+        srs_rows = [
+            ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", "undefined cartesian coordinate reference system"),
+            ("Undefined geographic SRS", 0, "NONE", 0, "undefined", "undefined geographic coordinate reference system"),
+            ("WGS 84 geodetic", 4326, "EPSG", 4326, CRS.from_epsg(4326).to_wkt("WKT1_GDAL"),
+             "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid"),
+        ]
+        if srs_id != 4326:
+            srs_rows.append((crs.name, srs_id, "EPSG", srs_id, crs.to_wkt("WKT1_GDAL"), None))
+        con.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", srs_rows)
+        cols = "".join(f", {_sql_name(n)} {t}" for n, (_, t) in zip(names, types))
+        con.execute(f"CREATE TABLE {_sql_name(table)} (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, geom POINT{cols})")
+        insert = (f"INSERT INTO {_sql_name(table)} (geom{''.join(', ' + _sql_name(n) for n in names)}) "
+                  f"VALUES ({', '.join('?' * (len(names) + 1))})")
 
+        xs, ys = array("d"), array("d")
+        pack = GPKG_POINT.pack
+        for chunk in chain([first], chunks):
+            batch = []
+            for x, y, r in iter_points(chunk, x_idx, y_idx):
+                xs.append(x); ys.append(y)
+                rec = [pack(b"GP", 0, 1, srs_id, 1, 1, x, y)]
+                for conv, i in zip(convs, attr_indices):
+                    v = r[i] if i < len(r) else None
+                    if isinstance(v, (list, dict, tuple, set)):
+                        v = str(v)
+                    rec.append(conv(v))
+                batch.append(rec)
+            if batch:
+                con.execute("BEGIN")
+                con.executemany(insert, batch)
+                con.execute("COMMIT")
+        count = len(xs)
+
+        bounds = (min(xs), min(ys), max(xs), max(ys)) if count else (None,) * 4
+        con.execute("BEGIN")
+        con.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) "
+                    "VALUES (?, 'features', ?, ?, ?, ?, ?, ?)", (table, table) + bounds + (srs_id,))
+        con.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 'POINT', ?, 0, 0)", (table, srs_id))
+        # R-tree 一次性装载：fid 与插入顺序一致（从 1 开始），按 Hilbert 顺序插入使节点更紧凑
+        rtree = f"rtree_{table}_geom"
+        con.execute(f"CREATE VIRTUAL TABLE {_sql_name(rtree)} USING rtree(id, minx, maxx, miny, maxy)")
+        order = curve_order(xs, ys, "hilbert")
+        con.executemany(f"INSERT INTO {_sql_name(rtree)} VALUES (?, ?, ?, ?, ?)",
+                        ((int(k) + 1, xs[k], xs[k], ys[k], ys[k]) for k in order))
+        con.execute("INSERT INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', "
+                    "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')", (table,))
+        con.execute("COMMIT")
+        # executescript 会先提交当前事务，所以放在事务之后
+        con.executescript(GPKG_RTREE_TRIGGERS.format(t=table.replace('"', '""'), c="geom", i="fid"))
+        con.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        con.close()
     return count
 
-def write_geojson(out_path, rows, headers, x_idx, y_idx, crs_epsg):
-    """写出 GeoJSON（点要素集合）"""
-    features = []
-    for r in rows:
-        x = try_float(r[x_idx] if x_idx < len(r) else None)
-        y = try_float(r[y_idx] if y_idx < len(r) else None)
-        if x is None or y is None:
-            continue
-        props = {}
-        for i, h in enumerate(headers):
-            if i in (x_idx, y_idx):
-                continue
-            v = r[i] if i < len(r) else None
-            if isinstance(v, (list, dict, tuple, set)):
-                v = str(v)
-            props[h or f"F{i}"] = v
-        feat = {
-            "type": "Feature",
-            "geometry": {"type": "Point", "coordinates": [x, y]},
-            "properties": props
-        }
-        features.append(feat)
-    fc = {"type": "FeatureCollection", "features": features}
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(fc, f, ensure_ascii=False)
-    return len(features)
+def output_files(out_path, fmt):
+    """一次导出会生成的全部文件"""
+    if fmt == "gpkg":
+        return [out_path, out_path + "-journal"]
+    if fmt != "shp":
+        return [out_path]
+    base = os.path.splitext(out_path)[0]
+    parts = [p for p in glob.glob(glob.escape(base) + "_part*") if os.path.splitext(p)[1] in SHP_PART_EXT]
+    return [base + ext for ext in SHP_PART_EXT] + parts + [manifest_path(out_path)]
+
+def remove_outputs(out_path, fmt, since=0.0):
+    """删除取消或失败后残留的不完整输出；只删除 since（时间戳）之后写过的文件，避免误删旧结果"""
+    for p in output_files(out_path, fmt):
+        if os.path.exists(p) and os.path.getmtime(p) >= since:
+            os.remove(p)
+
+def output_epsg(dst):
+    """写 .prj 用的 EPSG 编号；GCJ-02 / BD-09 没有 EPSG，按 WGS84 标注"""
+    return dst.split(":", 1)[1] if dst.startswith("EPSG:") else "4326"
+
+def export_sheet(path, sheet, x_name, y_name, out_path, fmt="shp", epsg="4326",
+                 precision=None, transform=None, log=print, progress=None, attrs=None, prof=None,
+                 order=None, qix=False, parallel=True):
+    """
+    导出单个 Sheet 的完整流程（GUI 与批处理共用）：流式读取 → [坐标转换] → 写出。
+    path 可以是 xlsx/xls，也可以是 CSV/Parquet（此时 sheet 被忽略）；
+    attrs 为要导出的属性列名列表，None 表示全部列，给定时只读取 X/Y 与这些列；
+    transform 为可选的 X/Y 转换函数（见 reproject_rows），在读取的同一遍中逐块转换后直接写出，不产生中间文件；
+    progress(done, total, stage) 每块回调一次，可抛异常以中止；
+    prof 为 StageProfiler，记录读取 / 扫描字段 / 转换 / 写出各阶段；
+    order / qix / parallel 只对 shp 有效：空间排序、.qix 索引与分卷并行写出（见 write_shapefile）；
+    gpkg 与 shp 一样先扫描一遍确定字段类型；返回写出的点数
+    """
+    if fmt not in FORMAT_EXT:
+        raise ValueError(f"不支持的格式：{fmt}")
+    prof = prof or StageProfiler(enabled=False)
+    columns = None
+    if attrs is not None:
+        columns = list(dict.fromkeys([x_name, y_name] + [a for a in attrs if a]))
+    data_rows = open_rows(path, sheet, columns)
+    spool = None
+    try:
+        header_row = next(data_rows, None)
+        if header_row is None:
+            raise ValueError("Sheet 为空")
+        headers = [str(c) if c is not None else "" for c in header_row]
+        if x_name not in headers or y_name not in headers:
+            raise ValueError("X/Y 列名不在表头里")
+        x_idx = headers.index(x_name)
+        y_idx = headers.index(y_name)
+
+        total = sheet_row_count(path, sheet) if progress else None
+
+        source = "读取"  # 行的来源计入的阶段；从暂存回放时改为“回放暂存”，源文件的读取只计一次
+
+        def stream(rows, stage, reproject=True):
+            rows = prof.iter(source, rows)
+            if progress:
+                rows = iter_progress(rows, progress, total, stage)
+            if transform and reproject:
+                rows = prof.iter("转换", reproject_rows(rows, x_idx, y_idx, transform))
+            return rows
+
+        if fmt in ("shp", "gpkg"):
+            # 先流式扫描一遍确定字段类型与宽度，再写出。扫描时把读到的行暂存到输出目录下的临时文件，
+            # 写出时从暂存回放，源文件只解析一次。字段不含 X/Y，扫描时不做坐标转换；
+            # 个别坐标转换失败的行会在写出时跳过，有效点数只作分卷估算的上界
+            spool = RowSpool(os.path.dirname(os.path.abspath(out_path)))
+            with prof.stage("扫描字段"):
+                scan_rows = spool.tee(stream(data_rows, "扫描字段", reproject=False))
+                inferer = scan_schema(scan_rows, headers, x_idx, y_idx)
+            data_rows.close()
+            data_rows = spool.replay()
+            source = "回放暂存"
+        if fmt == "shp":
+            schema = inferer.fields()
+            log("字段：" + "，".join(f"{n}({t}{s}{'.' + str(d) if d else ''})" for n, t, s, d in schema))
+            with prof.stage("写出"):
+                n = write_shapefile(out_path, stream(data_rows, "写出"), headers, x_idx, y_idx, epsg, schema=schema,
+                                    order=order, qix=qix, total=inferer.count, parallel=parallel)
+            if os.path.exists(manifest_path(out_path)):
+                with open(manifest_path(out_path), encoding="utf-8") as f:
+                    n_parts = len(json.load(f)["parts"])
+                log(f"超过单文件 2 GB 上限，已拆分为 {n_parts} 个分卷，清单：{manifest_path(out_path)}")
+        elif fmt == "gpkg":
+            types = inferer.sql_types()
+            log("字段：" + "，".join(f"{n}({t})" for n, t in types))
+            with prof.stage("写出"):
+                n = write_geopackage(out_path, stream(data_rows, "写出"), headers, x_idx, y_idx, epsg, types=types)
+        else:
+            writer = write_geojson if fmt == "geojson" else write_geojsonseq
+            with prof.stage("写出"):
+                n = writer(out_path, stream(data_rows, "写出"), headers, x_idx, y_idx, epsg, precision=precision)
+        prof.add_rows("写出", n)
+        return n
+    finally:
+        data_rows.close()
+        if spool is not None:
+            spool.close()
 
 # =============== Tk GUI ===============
+ORDER_CHOICES = {"不排序": None, "Hilbert 曲线": "hilbert", "Z-order 曲线": "zorder"}
 
 class VectorApp(tk.Tk):
     def __init__(self):
@@ -132,7 +783,7 @@ class VectorApp(tk.Tk):
 
         # 行 1：Excel 文件
         f1 = ttk.Frame(self); f1.pack(fill="x", padx=8, pady=6)
-        ttk.Label(f1, text="Excel 文件").pack(side="left")
+        ttk.Label(f1, text="数据文件").pack(side="left")
         self.var_file = tk.StringVar()
         ttk.Entry(f1, textvariable=self.var_file, width=70).pack(side="left", padx=6)
         ttk.Button(f1, text="浏览", command=self.pick_file).pack(side="left")
@@ -151,14 +802,46 @@ class VectorApp(tk.Tk):
         ttk.Label(f3, text="Y 列（纬度/北向）").pack(side="left")
         self.cmb_y = ttk.Combobox(f3, width=27, state="readonly"); self.cmb_y.pack(side="left", padx=6)
 
-        # 行 4：坐标系 + 格式
+        # 行 3b：属性列（CSV / Parquet 只读取 X/Y 与这些列）
+        f3b = ttk.Frame(self); f3b.pack(fill="x", padx=8, pady=6)
+        ttk.Label(f3b, text="属性列（逗号分隔，留空=全部）").pack(side="left")
+        self.var_attrs = tk.StringVar()
+        ttk.Entry(f3b, textvariable=self.var_attrs, width=70).pack(side="left", padx=6)
+
+        # 行 4a：坐标系（输入与输出不同时，读取时逐块转换后直接写出）
+        f4a = ttk.Frame(self); f4a.pack(fill="x", padx=8, pady=6)
+        ttk.Label(f4a, text="输入坐标系").pack(side="left")
+        self.cmb_src = ttk.Combobox(f4a, values=[n for n, _ in PRESETS], width=24, state="readonly")
+        self.cmb_src.set(PRESETS[0][0]); self.cmb_src.pack(side="left", padx=6)
+        self.var_src_epsg = tk.StringVar()
+        ttk.Entry(f4a, textvariable=self.var_src_epsg, width=10).pack(side="left")
+        ttk.Label(f4a, text="输出坐标系").pack(side="left", padx=(12, 0))
+        self.cmb_dst = ttk.Combobox(f4a, values=[n for n, _ in PRESETS], width=24, state="readonly")
+        self.cmb_dst.set(PRESETS[0][0]); self.cmb_dst.pack(side="left", padx=6)
+        self.var_dst_epsg = tk.StringVar()
+        ttk.Entry(f4a, textvariable=self.var_dst_epsg, width=10).pack(side="left")
+        ttk.Label(f4a, text="（自定义 EPSG 选填）").pack(side="left", padx=6)
+
+        # 行 4：格式
         f4 = ttk.Frame(self); f4.pack(fill="x", padx=8, pady=6)
-        ttk.Label(f4, text="坐标系 EPSG").pack(side="left")
-        self.var_epsg = tk.StringVar(value="4326")
-        ttk.Entry(f4, textvariable=self.var_epsg, width=12).pack(side="left", padx=6)
         self.var_fmt = tk.StringVar(value="shp")
         ttk.Radiobutton(f4, text="Shapefile (.shp)", variable=self.var_fmt, value="shp").pack(side="left", padx=12)
         ttk.Radiobutton(f4, text="GeoJSON (.geojson)", variable=self.var_fmt, value="geojson").pack(side="left")
+        ttk.Radiobutton(f4, text="GeoJSONSeq (.geojsons)", variable=self.var_fmt, value="geojsonseq").pack(side="left", padx=12)
+        ttk.Radiobutton(f4, text="GeoPackage (.gpkg)", variable=self.var_fmt, value="gpkg").pack(side="left")
+        ttk.Label(f4, text="坐标小数位(选填)").pack(side="left")
+        self.var_precision = tk.StringVar()
+        ttk.Entry(f4, textvariable=self.var_precision, width=6).pack(side="left", padx=6)
+        self.var_profile = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f4, text="保存性能分析 JSON", variable=self.var_profile).pack(side="left", padx=6)
+
+        # 行 4b：Shapefile 空间排序与索引
+        f4b = ttk.Frame(self); f4b.pack(fill="x", padx=8, pady=6)
+        ttk.Label(f4b, text="SHP 空间排序").pack(side="left")
+        self.cmb_order = ttk.Combobox(f4b, width=12, state="readonly", values=list(ORDER_CHOICES))
+        self.cmb_order.set(next(iter(ORDER_CHOICES))); self.cmb_order.pack(side="left", padx=6)
+        self.var_qix = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f4b, text="生成 .qix 空间索引", variable=self.var_qix).pack(side="left", padx=12)
 
         # 行 5：输出文件
         f5 = ttk.Frame(self); f5.pack(fill="x", padx=8, pady=6)
@@ -170,7 +853,10 @@ class VectorApp(tk.Tk):
         # 行 6：按钮
         f6 = ttk.Frame(self); f6.pack(fill="x", padx=8, pady=4)
         ttk.Button(f6, text="预览前 5 行", command=self.preview).pack(side="left")
-        ttk.Button(f6, text="开始导出", command=self.run).pack(side="left", padx=8)
+        self.btn_run = ttk.Button(f6, text="开始导出", command=self.run)
+        self.btn_run.pack(side="left", padx=8)
+        self.btn_cancel = ttk.Button(f6, text="取消", command=self.cancel, state="disabled")
+        self.btn_cancel.pack(side="left")
         ttk.Label(self, text="© 2025 by Arope", anchor="center").pack(side="bottom", pady=4)
 
         # 日志
@@ -181,6 +867,7 @@ class VectorApp(tk.Tk):
         self.headers = []
         self.preview_rows = []
         self.all_sheets = []
+        self.task = None
 
     # ---------- 日志 ----------
     def log_print(self, *msg):
@@ -189,12 +876,16 @@ class VectorApp(tk.Tk):
 
     # ---------- 事件 ----------
     def pick_file(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel 文件", "*.xlsx;*.xls")])
+        path = filedialog.askopenfilename(filetypes=[("Excel / CSV / Parquet", "*.xlsx;*.xls;*.csv;*.parquet"),
+                                                     ("Excel 文件", "*.xlsx;*.xls"), ("CSV", "*.csv"),
+                                                     ("Parquet", "*.parquet")])
         if not path:
             return
         self.var_file.set(path)
         try:
-            sheets, headers, data = read_excel_preview(path)
+            session = get_session(path)
+            sheets = session.sheet_names
+            headers, data = session.preview(sheets[0]) if sheets else ([], [])
             self.all_sheets = sheets
             self.headers = headers
             self.preview_rows = data
@@ -210,7 +901,7 @@ class VectorApp(tk.Tk):
 
             # 默认输出路径
             base, _ = os.path.splitext(path)
-            default_ext = ".shp" if self.var_fmt.get() == "shp" else ".geojson"
+            default_ext = FORMAT_EXT.get(self.var_fmt.get(), ".shp")
             if not self.var_out.get():
                 self.var_out.set(base + "_points" + default_ext)
         except Exception as e:
@@ -222,7 +913,7 @@ class VectorApp(tk.Tk):
         if not (path and sheet):
             return
         try:
-            _, headers, data = read_excel_preview(path, sheet=sheet, max_rows=200)
+            headers, data = get_session(path).preview(sheet)
             self.headers = headers
             self.preview_rows = data
             self.cmb_x["values"] = headers
@@ -233,7 +924,7 @@ class VectorApp(tk.Tk):
 
     def preview(self):
         if not self.preview_rows:
-            self.log_print("请先选择 Excel 文件。")
+            self.log_print("请先选择数据文件。")
             return
         show = [self.headers] + self.preview_rows[:5]
         self.log_print("==== 预览 ====")
@@ -242,9 +933,10 @@ class VectorApp(tk.Tk):
 
     def pick_save(self):
         fmt = self.var_fmt.get()
-        ext = ".shp" if fmt == "shp" else ".geojson"
+        ext = FORMAT_EXT.get(fmt, ".shp")
         path = filedialog.asksaveasfilename(defaultextension=ext,
-                                            filetypes=[("Shapefile", "*.shp"), ("GeoJSON", "*.geojson")])
+                                            filetypes=[("Shapefile", "*.shp"), ("GeoJSON", "*.geojson"),
+                                                       ("GeoJSONSeq", "*.geojsons"), ("GeoPackage", "*.gpkg")])
         if path:
             self.var_out.set(path)
 
@@ -255,48 +947,94 @@ class VectorApp(tk.Tk):
             sheet = self.cmb_sheet.get()
             x_name = self.cmb_x.get()
             y_name = self.cmb_y.get()
-            epsg = (self.var_epsg.get() or "4326").strip()
+            src = resolve_crs(self.cmb_src.get(), self.var_src_epsg.get())
+            dst = resolve_crs(self.cmb_dst.get(), self.var_dst_epsg.get())
             out_path = self.var_out.get()
             fmt = self.var_fmt.get()
+            prec_text = (self.var_precision.get() or "").strip()
+            attrs_text = (self.var_attrs.get() or "").strip()
 
             if not (path and os.path.exists(path)):
-                self.log_print("[错误] 请选择有效的 Excel 文件。"); return
+                self.log_print("[错误] 请选择有效的数据文件。"); return
             if not sheet:
                 self.log_print("[错误] 请选择 Sheet。"); return
             if not (x_name and y_name):
                 self.log_print("[错误] 请选择 X/Y 列。"); return
             if not out_path:
                 self.log_print("[错误] 请选择输出文件。"); return
-            if fmt not in ("shp", "geojson"):
-                self.log_print("[错误] 只支持 shp 或 geojson。"); return
-
-            # 读取整表
-            wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
-            sh = wb[sheet]
-            rows = list(sh.iter_rows(values_only=True))
-            wb_headers = [str(c) if c is not None else "" for c in rows[0]]
-            if x_name not in wb_headers or y_name not in wb_headers:
-                wb.close()
-                self.log_print("[错误] X/Y 列名不在表头里。")
-                return
-            x_idx = wb_headers.index(x_name)
-            y_idx = wb_headers.index(y_name)
-            data_rows = rows[1:]
-            wb.close()
-
-            # 导出
-            if fmt == "shp":
-                n = write_shapefile(out_path, data_rows, wb_headers, x_idx, y_idx, epsg)
-            else:
-                n = write_geojson(out_path, data_rows, wb_headers, x_idx, y_idx, epsg)
+            if fmt not in FORMAT_EXT:
+                self.log_print("[错误] 只支持 shp、geojson、geojsonseq 或 gpkg。"); return
+            if prec_text and not prec_text.isdigit():
+                self.log_print("[错误] 坐标小数位须为非负整数。"); return
+            precision = int(prec_text) if prec_text else None
+            # 表头取自预览缓存，启动任务前先校验列名
+            headers = get_session(path).headers(sheet)
+            if x_name not in headers or y_name not in headers:
+                self.log_print("[错误] X/Y 列名不在表头里。"); return
+            attrs = [a.strip() for a in attrs_text.replace("，", ",").split(",") if a.strip()] if attrs_text else None
+            missing = [a for a in attrs or [] if a not in headers]
+            if missing:
+                self.log_print(f"[错误] 属性列不在表头里：{missing}"); return
+
+            transform = make_proj_transform(src, dst) if src != dst else None
+            epsg = output_epsg(dst)
+            self.log_print(f"坐标系：{src} -> {dst}" if transform else f"坐标系：{src}（不转换）")
+            if dst in ("GCJ-02", "BD-09"):
+                self.log_print(f"[提示] {dst} 没有 EPSG 编号，输出文件的坐标系按 WGS84 标注。")
+
+            order = ORDER_CHOICES.get(self.cmb_order.get())
+            qix = self.var_qix.get()
+            if fmt != "shp" and (order or qix):
+                self.log_print("[提示] 空间排序与 .qix 索引只用于 Shapefile，本次忽略。")
+            started = time.time()
+            save_profile = self.var_profile.get()
+            prof = StageProfiler(trace_memory=trace_memory_requested())
 
-            self.log_print(f"✅ 导出成功：{n} 个点 → {out_path}")
-            messagebox.showinfo("成功", f"导出成功：{n} 个点\n{out_path}")
+            def job(task):
+                prof.start()
+                try:
+                    return export_sheet(path, sheet, x_name, y_name, out_path, fmt=fmt, epsg=epsg,
+                                        precision=precision, transform=transform, log=task.log, progress=task.progress,
+                                        attrs=attrs, prof=prof, order=order, qix=qix)
+                finally:
+                    prof.stop()
+
+            def done(n, err):
+                self.task = None
+                self.btn_run.config(state="normal")
+                self.btn_cancel.config(state="disabled")
+                if isinstance(err, TaskCancelled):
+                    remove_outputs(out_path, fmt, since=started)
+                    self.log_print("已取消，未完成的输出已删除。")
+                elif err is not None:
+                    remove_outputs(out_path, fmt, since=started)
+                    self.log_print("[错误]", err)
+                    messagebox.showerror("错误", str(err))
+                else:
+                    for line in prof.summary_lines():
+                        self.log_print(line)
+                    if save_profile:
+                        p = prof.write_json(profile_path(out_path), tool="excel_to_vector", input=path,
+                                            sheet=sheet, format=fmt, points=n)
+                        self.log_print(f"性能分析已保存：{p}")
+                    self.log_print(f"✅ 导出成功：{n} 个点 → {out_path}")
+                    messagebox.showinfo("成功", f"导出成功：{n} 个点\n{out_path}")
+
+            self.btn_run.config(state="disabled")
+            self.btn_cancel.config(state="normal")
+            self.log_print(f"开始导出：{os.path.basename(path)} / {sheet}")
+            self.task = BackgroundTask(self, job, self.log_print, done).start()
         except Exception as e:
             self.log_print("[错误]", e)
             messagebox.showerror("错误", str(e))
 
+    def cancel(self):
+        if self.task and self.task.running:
+            self.task.cancel()
+            self.log_print("正在取消（当前块完成后停止）…")
+
 # =============== 入口 ===============
 if __name__ == "__main__":
+    freeze_support()  # 打包后的 EXE 中并行写分卷的子进程从这里进入
     VectorApp().mainloop()
 
@@ -0,0 +1,188 @@
+import os, sys, json, time, platform, tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+RSS_SAMPLE_EVERY = 5000  # iter() 中每隔多少项采样一次 RSS
+TRACE_MEMORY_ENV = "AROPE_TRACE_MEMORY"  # 设为 1 时界面运行额外开启 tracemalloc
+TRACE_MEMORY_NOTE = "开启了 tracemalloc：各阶段耗时会偏高数倍，不代表正常速度，计时请另跑一次"
+
+def trace_memory_requested():
+    """是否单独开启 tracemalloc（只看 Python 分配峰值时用；会显著拖慢运行，不与正常计时混用）"""
+    return os.environ.get(TRACE_MEMORY_ENV, "") not in ("", "0")
+
+def _windows_rss():
+    """Windows 下不依赖 psutil：ctypes 调 GetProcessMemoryInfo，取工作集大小"""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    kernel32, psapi = ctypes.WinDLL("kernel32"), ctypes.WinDLL("psapi")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
+
+def current_rss():
+    """当前进程常驻内存（字节）；优先 psutil，Windows 下用 ctypes，Linux 下读 /proc，取不到时返回 None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if os.name == "nt":
+        try:
+            return _windows_rss()
+        except (OSError, AttributeError):
+            return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _mb(n):
+    return f"{n / 1048576:.1f} MB" if n is not None else "-"
+
+class StageProfiler:
+    """
+    轻量分阶段计时：记录每个阶段的耗时、行数、行/秒与 RSS 峰值，整体记录 tracemalloc 峰值（可选）。
+    tracemalloc 会让分配密集的阶段慢好几倍，开启时输出里会注明耗时不具代表性。
+    流式管线中各阶段交替执行，stage()/iter() 可以嵌套，耗时按“自身”计算（扣除嵌套的下游阶段），
+    例如写出阶段从转换、读取阶段拉取数据的时间不计入写出。
+    enabled=False 时所有方法直接透传，几乎没有开销
+    """
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = OrderedDict()
+        self._stack = []
+        self._t0 = None
+        self.wall = 0.0
+        self.traced_peak = None
+        self.rss_peak = None
+
+    def _rec(self, name):
+        rec = self.stages.get(name)
+        if rec is None:
+            rec = self.stages[name] = {"seconds": 0.0, "rows": 0, "rss_peak": None}
+        return rec
+
+    def _sample_rss(self, rec):
+        rss = current_rss()
+        if rss is not None:
+            rec["rss_peak"] = max(rec["rss_peak"] or 0, rss)
+            self.rss_peak = max(self.rss_peak or 0, rss)
+
+    def start(self):
+        if self.enabled:
+            self._t0 = time.perf_counter()
+            if self.trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+        return self
+
+    def stop(self):
+        if self.enabled and self._t0 is not None:
+            self.wall = time.perf_counter() - self._t0
+            if self.trace_memory and tracemalloc.is_tracing():
+                self.traced_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        return self
+
+    @contextmanager
+    def stage(self, name, rows=0, sample=True):
+        if not self.enabled:
+            yield
+            return
+        self._stack.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            child = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += dt
+            rec = self._rec(name)
+            rec["seconds"] += dt - child
+            rec["rows"] += rows
+            if sample:
+                self._sample_rss(rec)
+
+    def add_rows(self, name, rows):
+        if self.enabled:
+            self._rec(name)["rows"] += rows
+
+    def iter(self, name, iterable, count=None):
+        """包装迭代器：产出每一项所花的时间计入 name；count(item) 给出该项的行数，默认每项 1 行"""
+        if not self.enabled:
+            return iterable
+        return self._iter(name, iterable, count)
+
+    def _iter(self, name, iterable, count):
+        it = iter(iterable)
+        rec = self._rec(name)
+        n = 0
+        try:
+            while True:
+                n += 1
+                with self.stage(name, sample=(n % RSS_SAMPLE_EVERY == 1)):
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                rec["rows"] += count(item) if count else 1
+                yield item
+        finally:
+            close = getattr(it, "close", None)
+            if close:
+                close()
+
+    # ---------- 输出 ----------
+    def to_dict(self, **meta):
+        stages = []
+        for name, rec in self.stages.items():
+            sec = rec["seconds"]
+            stages.append({"stage": name, "seconds": round(sec, 6), "rows": rec["rows"],
+                           "rows_per_sec": round(rec["rows"] / sec, 1) if sec > 0 and rec["rows"] else None,
+                           "rss_peak_bytes": rec["rss_peak"]})
+        return {
+            "meta": dict(meta, python=platform.python_version(), platform=platform.platform(),
+                         frozen=bool(getattr(sys, "frozen", False))),
+            "wall_seconds": round(self.wall, 6),
+            "rss_peak_bytes": self.rss_peak,
+            "tracemalloc_peak_bytes": self.traced_peak,
+            "timings_representative": not self.trace_memory,
+            **({"note": TRACE_MEMORY_NOTE} if self.trace_memory else {}),
+            "stages": stages,
+        }
+
+    def summary_lines(self):
+        lines = ["==== 阶段耗时 ===="]
+        for s in self.to_dict()["stages"]:
+            rate = f"{s['rows_per_sec']:,.0f} 行/秒" if s["rows_per_sec"] else "-"
+            lines.append(f"{s['stage']}：{s['seconds']:.2f}s，{s['rows']:,} 行，{rate}，RSS 峰值 {_mb(s['rss_peak_bytes'])}")
+        mem = f"RSS 峰值 {_mb(self.rss_peak)}"
+        if self.traced_peak is not None:
+            mem += f"，Python 分配峰值 {_mb(self.traced_peak)}"
+        lines.append(f"总耗时 {self.wall:.2f}s；{mem}")
+        if self.trace_memory:
+            lines.append(f"[提示] {TRACE_MEMORY_NOTE}")
+        return lines
+
+    def write_json(self, path, **meta):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(**meta), f, ensure_ascii=False, indent=2)
+        return path
+
+def profile_path(out_path):
+    """性能分析 JSON 放在输出文件旁边"""
+    return out_path + ".profile.json"
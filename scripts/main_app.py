@@ -1,10 +1,24 @@
+import sys, time, threading, importlib, multiprocessing
+_T0 = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk
-from app_tk import ConverterApp
-from excel_to_vector_tk import VectorApp
+
+# 工具模块会拉起 pandas / pyproj / openpyxl / pyshp，启动时不导入，
+# 启动窗口出现后在后台线程预热，点击按钮时再取用（预热未完成则等待导入锁）
+TOOL_MODULES = ("app_tk", "excel_to_vector_tk")
+
+def warm_up(timings):
+    """后台线程中依次导入工具模块，记录各自耗时；失败留给打开工具时报错"""
+    for name in TOOL_MODULES:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception:
+            return
+        timings[name] = time.perf_counter() - t0
 
 class MainApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, report_startup=False):
         super().__init__()
         self.title("Arope GIS Toolkit")
         self.geometry("420x220")
@@ -23,16 +37,48 @@ class MainApp(tk.Tk):
 
         ttk.Label(self, text="© 2025 by Arope", anchor="center").pack(side="bottom", pady=8)
 
+        self.report_startup = report_startup
+        self.import_times = {}
+        self.warm_thread = None
+        self.after_idle(self.on_ready)
+
+    def on_ready(self):
+        self.startup_time = time.perf_counter() - _T0
+        self.warm_thread = threading.Thread(target=warm_up, args=(self.import_times,), daemon=True)
+        self.warm_thread.start()
+        # 只在 --startup-time 时打印：打包成无控制台的 EXE 后 sys.stderr 为 None，平时启动不输出
+        if self.report_startup:
+            print(f"启动耗时：{self.startup_time * 1000:.0f} ms", file=sys.stderr)
+            self.after(100, self.report_and_quit)
+
+    def report_and_quit(self):
+        """--startup-time：等预热结束后打印各模块导入耗时并退出，用于发现启动变慢"""
+        if self.warm_thread.is_alive():
+            self.after(100, self.report_and_quit); return
+        for name, sec in self.import_times.items():
+            print(f"预热 {name}：{sec * 1000:.0f} ms", file=sys.stderr)
+        self.destroy()
+
+    def load_tool(self, module, cls):
+        self.config(cursor="watch"); self.update_idletasks()
+        try:
+            return getattr(importlib.import_module(module), cls)
+        finally:
+            self.config(cursor="")
+
     def open_converter(self):
+        ConverterApp = self.load_tool("app_tk", "ConverterApp")
         # 方案A：如果 ConverterApp 继承自 tk.Tk（你没改成 Toplevel）
         ConverterApp()
         # 如果你按我之前的“方案B”把它改成 tk.Toplevel，就用：
         # ConverterApp(self)
 
     def open_vector(self):
+        VectorApp = self.load_tool("excel_to_vector_tk", "VectorApp")
         # 同上，按你的类基类选择其一
         VectorApp()
         # VectorApp(self)
 
 if __name__ == "__main__":
-    MainApp().mainloop()
+    multiprocessing.freeze_support()  # 打包后的 EXE 中多进程转换的子进程从这里进入
+    MainApp(report_startup="--startup-time" in sys.argv[1:]).mainloop()
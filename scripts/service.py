@@ -0,0 +1,314 @@
+"""
+常驻本地转换服务：进程常驻，pandas / pyproj / openpyxl 只导入一次，PROJ 数据目录与
+Transformer 保持预热，适合其他工具频繁提交的小批量任务。只监听本机回环地址（HTTP + JSON）。
+
+安全：/export 会读写任意本地路径，服务始终要求令牌。未指定 --token（或环境变量 AROPE_SERVICE_TOKEN）时
+启动时随机生成，并写入 ~/.arope_gis/service_token（仅当前用户可读），ServiceClient 默认从这里读取。
+POST 必须是 Content-Type: application/json，带 Origin 头的请求（浏览器网页发起的跨站请求）一律拒绝；
+可用 --out-dir 把导出输出限制在指定目录内。
+
+接口：
+    GET  /health     状态、已运行时间、已处理请求数
+    POST /transform  {"src": "BD-09", "dst": "EPSG:3857", "x": [...], "y": [...]}
+                     坐标也可用 "x_b64"/"y_b64"（小端 float64 的 base64），响应用相同编码；
+                     无效坐标写 null（或 NaN），对应结果也为 null
+    POST /export     {"path": ..., "sheet": ..., "x": 列名, "y": 列名, "out": ..., "format": "shp",
+                      "src": ..., "dst": ..., "attrs": [...], "order": null, "qix": false}
+                     sheet 省略时取第一个 Sheet
+每个响应都带 "metrics"：服务端总耗时、各阶段耗时与行数。
+
+示例：
+    python service.py --port 8765
+    >>> from service import ServiceClient
+    >>> ServiceClient(port=8765).transform([116.404], [39.915], "BD-09", "EPSG:4326")
+"""
+import os, sys, hmac, json, time, base64, secrets, argparse, threading
+import urllib.request, urllib.error
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import freeze_support
+
+import numpy as np
+from pyproj import CRS
+from pyproj.exceptions import CRSError
+
+from app_tk import PRESETS, make_proj_transform, transform_columns
+from batch_cli import parse_crs
+from excel_to_vector_tk import FORMAT_EXT, export_sheet, output_epsg
+from workbook_session import get_session
+
+DEFAULT_PORT = 8765
+MAX_BODY = 256 << 20  # 单个请求体上限 256 MB
+TOKEN_HEADER = "X-Arope-Token"
+TOKEN_ENV = "AROPE_SERVICE_TOKEN"
+
+def default_token_file():
+    return os.path.join(os.path.expanduser("~"), ".arope_gis", "service_token")
+
+def save_token(token, path=None):
+    """把令牌写入文件（仅当前用户可读写），供同一用户的 ServiceClient 读取"""
+    path = path or default_token_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return path
+
+def load_token(path=None):
+    """客户端取令牌：环境变量 AROPE_SERVICE_TOKEN 优先，其次令牌文件；都没有时返回 None"""
+    token = os.environ.get(TOKEN_ENV)
+    if token:
+        return token
+    try:
+        with open(path or default_token_file(), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+@lru_cache(maxsize=64)
+def get_transform(src, dst, fast):
+    """
+    常驻进程内复用转换函数（Transformer 本身另有 get_transformer 缓存）。
+    fast 必须显式传 bool：lru_cache 按实参形式区分键，(a, b) 与 (a, b, False) 会各建一份
+    """
+    return make_proj_transform(src, dst, fast=fast)
+
+@lru_cache(maxsize=256)
+def checked_crs(text):
+    """parse_crs 并校验 EPSG 编号确实存在；未知编号抛 CRSError（按请求错误返回 400）"""
+    code = parse_crs(text)
+    if code.startswith("EPSG:"):
+        CRS.from_user_input(code)
+    return code
+
+def warm_presets():
+    """启动时为各预设坐标系两两构建一次转换并试算一个点，首个请求不再付初始化开销"""
+    for _, src in PRESETS:
+        for _, dst in PRESETS:
+            if src != dst:
+                get_transform(src, dst, False)(np.array([116.4]), np.array([39.9]))
+
+def _decode_coords(req, key):
+    if key + "_b64" in req:
+        return np.frombuffer(base64.b64decode(req[key + "_b64"]), dtype="<f8").astype(np.float64)
+    return np.array([np.nan if v is None else v for v in req[key]], dtype=np.float64)
+
+def _encode_coords(values, b64):
+    if b64:
+        return base64.b64encode(np.ascontiguousarray(values, dtype="<f8").tobytes()).decode("ascii")
+    return [v if np.isfinite(v) else None for v in values.tolist()]
+
+def handle_transform(req, srv=None):
+    metrics = {}
+    t0 = time.perf_counter()
+    src, dst = checked_crs(req["src"]), checked_crs(req["dst"])
+    x, y = _decode_coords(req, "x"), _decode_coords(req, "y")
+    if len(x) != len(y):
+        raise ValueError("x 与 y 长度不一致")
+    t1 = time.perf_counter()
+    metrics["parse_seconds"] = t1 - t0
+    f = get_transform(src, dst, bool(req.get("fast", False)))
+    x_out, y_out = transform_columns(f, x, y) if src != dst else (x.copy(), y.copy())
+    x_out[~np.isfinite(x_out) | ~np.isfinite(y_out)] = np.nan
+    y_out[np.isnan(x_out)] = np.nan
+    t2 = time.perf_counter()
+    metrics["transform_seconds"] = t2 - t1
+    b64 = "x_b64" in req
+    res = {"src": src, "dst": dst, "rows": len(x)}
+    res["x_b64" if b64 else "x"] = _encode_coords(x_out, b64)
+    res["y_b64" if b64 else "y"] = _encode_coords(y_out, b64)
+    metrics["encode_seconds"] = time.perf_counter() - t2
+    return res, metrics
+
+def check_out_path(out, out_dir):
+    """out_dir 不为空时，输出文件必须位于该目录（含子目录）内"""
+    if out_dir:
+        root = os.path.realpath(out_dir)
+        if os.path.commonpath([root, os.path.realpath(out)]) != root:
+            raise ValueError(f"输出路径不在允许的目录内：{out_dir}")
+
+def handle_export(req, srv=None):
+    metrics = {}
+    fmt = req.get("format", "shp")
+    if fmt not in FORMAT_EXT:
+        raise ValueError(f"不支持的格式：{fmt}")
+    check_out_path(req["out"], srv and srv.out_dir)
+    src = checked_crs(req.get("src") or "EPSG:4326")
+    dst = checked_crs(req["dst"]) if req.get("dst") else src
+    transform = get_transform(src, dst, bool(req.get("fast", False))) if src != dst else None
+    sheet = req.get("sheet") or get_session(req["path"]).sheet_names[0]
+    lines = []
+    t0 = time.perf_counter()
+    n = export_sheet(req["path"], sheet, req["x"], req["y"], req["out"], fmt=fmt,
+                     epsg=output_epsg(dst), precision=req.get("precision"), transform=transform,
+                     log=lambda *msg: lines.append(" ".join(map(str, msg))), attrs=req.get("attrs"),
+                     order=req.get("order"), qix=bool(req.get("qix", False)))
+    metrics["export_seconds"] = time.perf_counter() - t0
+    return {"points": n, "out": req["out"], "sheet": sheet, "src": src, "dst": dst, "log": lines}, metrics
+
+ROUTES = {"/transform": handle_transform, "/export": handle_export}
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "AropeGIS/1"
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        # 浏览器里的网页可以向 127.0.0.1 发 text/plain 的跨站 POST（不触发 CORS 预检），
+        # 这类请求总会带 Origin 头；本服务只给本机程序调用，带 Origin 的一律拒绝
+        if self.headers.get("Origin") is not None:
+            self._reply(403, {"error": "不接受浏览器发起的跨站请求"})
+            return False
+        token = self.server.token
+        if not hmac.compare_digest((self.headers.get(TOKEN_HEADER) or "").encode(), token.encode()):
+            self._reply(403, {"error": "token 不正确"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path != "/health":
+            self._reply(404, {"error": f"未知路径：{self.path}"})
+            return
+        srv = self.server
+        self._reply(200, {"status": "ok", "pid": os.getpid(), "uptime_seconds": time.time() - srv.started,
+                          "requests": srv.requests, "transforms_cached": get_transform.cache_info().currsize})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        t0 = time.perf_counter()
+        handler = ROUTES.get(self.path)
+        if handler is None:
+            self._reply(404, {"error": f"未知路径：{self.path}"})
+            return
+        if self.headers.get_content_type() != "application/json":
+            self._reply(415, {"error": "Content-Type 须为 application/json"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self._reply(413, {"error": f"请求体超过 {MAX_BODY >> 20} MB"})
+            return
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+            res, metrics = handler(req, self.server)
+        except (KeyError, ValueError, TypeError, FileNotFoundError, CRSError) as e:
+            msg = f"缺少字段：{e}" if isinstance(e, KeyError) else str(e)
+            self._reply(400, {"error": msg})
+            return
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            with self.server.lock:
+                self.server.requests += 1
+        metrics["server_seconds"] = time.perf_counter() - t0
+        res["metrics"] = metrics
+        self._reply(200, res)
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, token=None, verbose=False, out_dir=None):
+    """
+    创建（未启动的）服务；port=0 时由系统分配端口，见 server.server_address。
+    token 为空时随机生成（见 server.token）；out_dir 限制 /export 的输出目录
+    """
+    srv = ThreadingHTTPServer((host, port), ServiceHandler)
+    srv.daemon_threads = True
+    srv.token = token or secrets.token_urlsafe(32)
+    srv.out_dir = out_dir
+    srv.verbose = verbose
+    srv.started = time.time()
+    srv.requests = 0
+    srv.lock = threading.Lock()
+    return srv
+
+class ServiceClient:
+    """
+    调用常驻服务的小工具，调用方不必关心协议细节。
+    坐标以 base64 二进制传输（比 JSON 数字列表小且快）；每次调用的结果里带服务端 metrics，
+    另加 "latency_seconds"（客户端测得的往返耗时）。服务返回错误时抛出 RuntimeError。
+    token 为空时按 load_token() 从环境变量或令牌文件读取
+    """
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, token=None, timeout=600, token_file=None):
+        self.base = f"http://{host}:{port}"
+        self.token = token or load_token(token_file)
+        self.timeout = timeout
+
+    def _call(self, path, body=None):
+        data = None if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(self.base + path, data=data, method="GET" if body is None else "POST")
+        req.add_header("Content-Type", "application/json; charset=utf-8")
+        if self.token:
+            req.add_header(TOKEN_HEADER, self.token)
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                res = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            try:
+                msg = json.loads(e.read()).get("error")
+            except ValueError:
+                msg = None
+            raise RuntimeError(f"服务返回 {e.code}：{msg or e.reason}") from None
+        res.setdefault("metrics", {})["latency_seconds"] = time.perf_counter() - t0
+        return res
+
+    def health(self):
+        return self._call("/health")
+
+    def transform(self, x, y, src, dst, fast=False):
+        """返回 (x_out, y_out, metrics)，x_out/y_out 为 float64 数组，无效坐标为 NaN"""
+        res = self._call("/transform", {"src": src, "dst": dst, "fast": fast,
+                                        "x_b64": _encode_coords(np.asarray(x, dtype=np.float64), True),
+                                        "y_b64": _encode_coords(np.asarray(y, dtype=np.float64), True)})
+        x_out = np.frombuffer(base64.b64decode(res["x_b64"]), dtype="<f8")
+        y_out = np.frombuffer(base64.b64decode(res["y_b64"]), dtype="<f8")
+        return x_out, y_out, res["metrics"]
+
+    def export(self, path, x, y, out, sheet=None, fmt="shp", src="EPSG:4326", dst=None, **options):
+        """导出整个 Sheet / CSV / Parquet（参数同 export_sheet，sheet 省略时取第一个），返回服务端结果字典"""
+        return self._call("/export", dict(options, path=path, sheet=sheet, x=x, y=y, out=out,
+                                          format=fmt, src=src, dst=dst))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="常驻本地坐标转换 / 导出服务（仅本机访问）")
+    ap.add_argument("--host", default="127.0.0.1", help="监听地址，默认只接受本机连接")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                    help=f"访问令牌，客户端需在 {TOKEN_HEADER} 头中携带；默认取环境变量 {TOKEN_ENV}，都没有时随机生成")
+    ap.add_argument("--token-file", default=default_token_file(),
+                    help="令牌写入的文件（仅当前用户可读），ServiceClient 默认从这里读取")
+    ap.add_argument("--out-dir", help="只允许 /export 写到这个目录（含子目录）内")
+    ap.add_argument("--no-warm", action="store_true", help="启动时不预热预设坐标系之间的转换")
+    ap.add_argument("-v", "--verbose", action="store_true", help="打印每个请求")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if not args.no_warm:
+        warm_presets()
+    srv = make_server(args.host, args.port, args.token, args.verbose, args.out_dir)
+    token_file = save_token(srv.token, args.token_file)
+    host, port = srv.server_address[:2]
+    print(f"访问令牌已写入 {token_file}", flush=True)
+    print(f"服务已启动：http://{host}:{port}（预热 {time.perf_counter() - t0:.2f}s），Ctrl+C 退出", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+    return 0
+
+if __name__ == "__main__":
+    freeze_support()  # 打包后的 EXE 中多进程的子进程从这里进入
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import struct
+import numpy as np
+
+CURVE_BITS = 16  # 每个坐标轴量化的位数（65536 × 65536 网格）
+CURVES = ("hilbert", "zorder")
+QIX_LEAF = 16    # 四叉树叶节点最多容纳的点数
+
+def quantize(xs, ys, bits=CURVE_BITS):
+    """把坐标按整体范围量化为 [0, 2^bits) 的整数格网坐标"""
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    top = (1 << bits) - 1
+    def scale(v):
+        lo, hi = v.min(), v.max()
+        if hi <= lo:
+            return np.zeros(v.shape, dtype=np.int64)
+        return np.minimum(((v - lo) / (hi - lo) * top).astype(np.int64), top)
+    return scale(xs), scale(ys)
+
+def _spread_bits(v):
+    """把 16 位整数的各位间隔开（第 k 位移到第 2k 位），用于 Morton 编码"""
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+def zorder_keys(ix, iy):
+    return _spread_bits(ix) | (_spread_bits(iy) << 1)
+
+def hilbert_keys(ix, iy, bits=CURVE_BITS):
+    """Hilbert 曲线序号（整列逐位计算，每轮处理一位）"""
+    n = 1 << bits
+    x, y = ix.copy(), iy.copy()
+    d = np.zeros(x.shape, dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # 旋转 / 翻转子象限，使下一位在统一的方向上编码
+        flip = rx & ~ry
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+def curve_order(xs, ys, curve="hilbert"):
+    """按空间填充曲线排序后的下标；相同序号保持原顺序"""
+    if curve not in CURVES:
+        raise ValueError(f"不支持的排序方式：{curve}")
+    if len(xs) == 0:
+        return np.zeros(0, dtype=np.intp)
+    ix, iy = quantize(xs, ys)
+    keys = hilbert_keys(ix, iy) if curve == "hilbert" else zorder_keys(ix, iy)
+    return np.argsort(keys, kind="stable")
+
+def qix_max_depth(n):
+    """与 MapServer shptree 相同的默认深度：使每个叶节点平均约 4 个要素"""
+    depth, nodes = 0, 1
+    while nodes * 4 < n:
+        depth += 1
+        nodes *= 2
+    return min(depth, CURVE_BITS)
+
+def write_qix(path, xs, ys, leaf_size=QIX_LEAF):
+    """
+    写出 .qix 四叉树空间索引（MapServer / shapelib 的 "SQT" 格式，小端，version 1），
+    xs/ys 为按要素写出顺序排列的点坐标，要素号从 0 开始。
+    四叉树按 Morton 码划分：同一节点下的点在 Morton 序中连续，用二分查找切分子节点；
+    节点矩形取所含点的紧包围盒
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    n = len(xs)
+    max_depth = qix_max_depth(n)
+    if n:
+        ix, iy = quantize(xs, ys)
+        codes = zorder_keys(ix, iy)
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+    else:
+        order = codes = np.zeros(0, dtype=np.int64)
+
+    def node(lo, hi, depth, prefix):
+        """返回 (记录片段列表, 子树字节数)；每条记录：子树偏移、包围盒、要素号、子节点数"""
+        ids = order[lo:hi]
+        if hi > lo:
+            rect = (xs[ids].min(), ys[ids].min(), xs[ids].max(), ys[ids].max())
+        else:
+            rect = (0.0, 0.0, 0.0, 0.0)
+        parts, size, nsub = [], 0, 0
+        if depth < max_depth and hi - lo > leaf_size:
+            shift = 2 * (CURVE_BITS - depth - 1)
+            cuts = np.searchsorted(codes[lo:hi], [(prefix * 4 + q) << shift for q in range(5)]) + lo
+            for q in range(4):
+                if cuts[q + 1] > cuts[q]:
+                    p, s = node(cuts[q], cuts[q + 1], depth + 1, prefix * 4 + q)
+                    parts += p
+                    size += s
+                    nsub += 1
+            ids = ids[:0]
+        head = (struct.pack("<i4di", size, *rect, len(ids)) + ids.astype("<i4").tobytes()
+                + struct.pack("<i", nsub))
+        return [head] + parts, len(head) + size
+
+    parts, _ = node(0, n, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"SQT" + bytes([1, 1, 0, 0, 0]))  # 签名、字节序（1=LSB）、版本、保留
+        f.write(struct.pack("<ii", n, max_depth))
+        f.writelines(parts)
+    return path
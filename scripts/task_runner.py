@@ -0,0 +1,100 @@
+import threading, queue, time
+
+PROGRESS_EVERY = 5000  # iter_progress 默认每多少行回调一次
+
+class TaskCancelled(Exception):
+    """用户点击取消后，在下一个进度检查点（块边界）抛出"""
+
+def iter_progress(rows, progress, total=None, stage="", every=PROGRESS_EVERY):
+    """透传行迭代器，每 every 行回调一次 progress(done, total, stage)；回调可抛异常以中止（取消）"""
+    progress(0, total, stage)
+    done = 0
+    for r in rows:
+        yield r
+        done += 1
+        if done % every == 0:
+            progress(done, total, stage)
+    progress(done, total, stage)
+
+class BackgroundTask:
+    """
+    在工作线程中执行 fn(task)，避免阻塞 Tk 主线程。
+    日志与进度经队列回到主线程（after() 轮询），fn 内不要直接操作任何控件：
+      task.log(...)                    输出一行日志
+      task.progress(done, total, stage) 报告进度；已取消时抛出 TaskCancelled
+    结束后在主线程调用 on_done(result, error)，取消时 error 为 TaskCancelled
+    """
+    def __init__(self, root, fn, log, on_done, poll_ms=100, progress_interval=1.0):
+        self.root = root
+        self.fn = fn
+        self.on_log = log
+        self.on_done = on_done
+        self.poll_ms = poll_ms
+        self.progress_interval = progress_interval
+        self._q = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+        self._stage = None
+        self._stage_t0 = 0.0
+        self._stage_done0 = 0
+        self._last_report = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_ms, self._poll)
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    # ---------- 工作线程侧 ----------
+    def log(self, *msg):
+        self._q.put(("log", " ".join(map(str, msg))))
+
+    def progress(self, done, total=None, stage=""):
+        if self._cancel.is_set():
+            raise TaskCancelled()
+        now = time.perf_counter()
+        if stage != self._stage:
+            self._stage, self._stage_t0, self._stage_done0 = stage, now, done
+            self._last_report = now
+            return
+        finished = total is not None and done >= total
+        if not finished and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        elapsed = now - self._stage_t0
+        rate = (done - self._stage_done0) / elapsed if elapsed > 0 else 0.0
+        msg = f"{stage}：{done:,}" + (f"/{total:,}" if total else "") + f" 行，{rate:,.0f} 行/秒"
+        if total and rate > 0 and not finished:
+            msg += f"，剩余约 {(total - done) / rate:.0f}s"
+        self.log(msg)
+
+    def _run(self):
+        try:
+            self._q.put(("done", self.fn(self), None))
+        except BaseException as e:
+            self._q.put(("done", None, e))
+
+    # ---------- 主线程侧 ----------
+    def _poll(self):
+        try:
+            while True:
+                kind, *payload = self._q.get_nowait()
+                if kind == "log":
+                    self.on_log(payload[0])
+                else:
+                    self.on_done(*payload)
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._poll)
@@ -0,0 +1,132 @@
+import os, hashlib
+import numpy as np
+
+CACHE_MAX_BYTES = 1 << 30   # 缓存目录总大小上限，超过后按最近使用时间淘汰
+CACHE_BLOCK_AVG = 1 << 14   # 分块平均行数（须为 2 的幂）
+CACHE_BLOCK_MIN = 1 << 12
+CACHE_BLOCK_MAX = 1 << 16
+CACHE_VERSION = b"v1"       # 结果格式或转换公式变化时改这里，旧缓存自然失效
+
+def default_cache_dir():
+    return os.environ.get("AROPE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".arope_gis", "transform_cache")
+
+def block_bounds(x, y):
+    """
+    按内容切块（content-defined chunking）：某行坐标的哈希低位全为 0 时在该行前切开，
+    块长限制在 [CACHE_BLOCK_MIN, CACHE_BLOCK_MAX]。插入或删除几行只影响附近的块，
+    后面的块边界不会整体错位，仍能命中缓存。返回各块起点（含末尾 n）
+    """
+    n = len(x)
+    xb = np.ascontiguousarray(x, dtype=np.float64).view(np.uint64)
+    yb = np.ascontiguousarray(y, dtype=np.float64).view(np.uint64)
+    h = (xb * np.uint64(0x9E3779B97F4A7C15)) ^ (yb * np.uint64(0xC2B2AE3D27D4EB4F))
+    cand = np.flatnonzero(((h >> np.uint64(40)) & np.uint64(CACHE_BLOCK_AVG - 1)) == 0)
+    bounds, pos = [0], 0
+    while n - pos > CACHE_BLOCK_MIN:
+        i = np.searchsorted(cand, pos + CACHE_BLOCK_MIN)
+        pos = min(int(cand[i]) if i < len(cand) else n, pos + CACHE_BLOCK_MAX, n)
+        bounds.append(pos)
+    if bounds[-1] != n:
+        bounds.append(n)
+    return bounds
+
+class TransformCache:
+    """
+    坐标转换结果的磁盘缓存，按内容寻址：键为 (输入块的 X/Y 字节, 转换参数) 的哈希，
+    值为该块转换后的 X/Y（小端 float64 原始字节，先 X 后 Y）。
+    同一份数据重复转换时整列命中、跳过转换；只改了部分行时只重算变化所在的块。
+    命中时刷新文件修改时间，目录超过 max_bytes 时按修改时间淘汰最久未用的块（LRU）
+    """
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hit_rows = 0
+        self.miss_rows = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key, x, y):
+        h = hashlib.blake2b(CACHE_VERSION + repr(key).encode("utf-8"), digest_size=20)
+        h.update(np.ascontiguousarray(x, dtype="<f8").tobytes())
+        h.update(np.ascontiguousarray(y, dtype="<f8").tobytes())
+        return os.path.join(self.cache_dir, h.hexdigest() + ".bin")
+
+    def _load(self, path, n):
+        try:
+            with open(path, "rb") as f:
+                data = np.frombuffer(f.read(), dtype="<f8")
+        except OSError:
+            return None
+        if len(data) != 2 * n:  # 写了一半或被截断，当作未命中
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data[:n], data[n:]
+
+    def _store(self, path, x_out, y_out):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(np.ascontiguousarray(x_out, dtype="<f8").tobytes())
+                f.write(np.ascontiguousarray(y_out, dtype="<f8").tobytes())
+            os.replace(tmp, path)  # 原子替换，并发读取不会看到半个文件
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def transform(self, key, x, y, compute):
+        """
+        key：转换参数（如 make_proj_transform 的 f.crs）；compute(x, y) 计算未命中的行，
+        各未命中块拼在一起只调用一次，多进程转换仍然有效。返回 (x_out, y_out)
+        """
+        n = len(x)
+        x_out = np.empty(n)
+        y_out = np.empty(n)
+        bounds = block_bounds(x, y)
+        misses = []
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            path = self._path(key, x[a:b], y[a:b])
+            cached = self._load(path, b - a)
+            if cached is None:
+                misses.append((a, b, path))
+            else:
+                x_out[a:b], y_out[a:b] = cached
+                self.hit_rows += b - a
+        if misses:
+            idx = np.concatenate([np.arange(a, b) for a, b, _ in misses])
+            mx, my = compute(x[idx], y[idx])
+            x_out[idx], y_out[idx] = mx, my
+            for a, b, path in misses:
+                self._store(path, x_out[a:b], y_out[a:b])
+            self.miss_rows += len(idx)
+            self.evict()
+        return x_out, y_out
+
+    def evict(self):
+        """目录总大小超过上限时，从最久未使用的块开始删除，删到上限的九成"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if e.name.endswith(".bin"):
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def summary(self):
+        n = self.hit_rows + self.miss_rows
+        ratio = self.hit_rows / n if n else 0.0
+        return f"转换缓存：命中 {self.hit_rows:,} 行，重算 {self.miss_rows:,} 行（命中率 {ratio:.0%}）"
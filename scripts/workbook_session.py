@@ -0,0 +1,287 @@
+import os, math, threading
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+import openpyxl
+
+MAX_SESSIONS = 4  # 同时缓存的工作簿数，超出按最近最少使用淘汰
+TABLE_EXT = (".csv", ".parquet")  # 单表文件：只有一个“sheet”，按块读取
+FRAME_CHUNK = 100_000             # CSV / Parquet 每块行数
+CSV_INT_TEXT = r"0|-?[1-9]\d{0,17}"  # 可无损转为 int64 的整数文本（无前导零、无正号）
+CSV_DEC_TEXT = r"-?(?:0|[1-9]\d*)\.\d+"  # 普通定点小数（12.30、45.00、-0.5），按数值读取
+CSV_DEC_DIGITS = 15  # 小数的有效数字上限：不超过 15 位时 float64 不丢信息
+
+def file_stamp(path):
+    """文件指纹 (mtime, size)，任一变化即视为文件已修改"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def fit_row(row, width):
+    """把一行补齐或截断到表头宽度（只读模式下行长度可能不一致）"""
+    row = tuple(row)
+    if len(row) == width:
+        return row
+    return row[:width] + (None,) * (width - len(row))
+
+def iter_sheet_rows(path, sheet):
+    """以只读模式逐行读取 Sheet（第一行为表头）；迭代结束或 close() 时关闭工作簿"""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb[sheet].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def _iter_xls_rows(path, sheet, nrows=None):
+    """.xls 由 pandas（xlrd）读取，按行产出，空值转为 None"""
+    import pandas as pd
+    df = pd.read_excel(path, sheet_name=sheet, header=None, nrows=nrows)
+    df = df.astype(object).where(df.notna(), None)
+    yield from df.itertuples(index=False, name=None)
+
+# ---------- CSV / Parquet ----------
+def is_table_file(path):
+    return os.path.splitext(path)[1].lower() in TABLE_EXT
+
+def csv_encoding(path):
+    """按文件开头判断 CSV 编码：UTF-8（含 BOM）或 GBK（国内系统导出的常见编码）"""
+    with open(path, "rb") as f:
+        head = f.read(1 << 16)
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # 截断在多字节字符中间不算错
+        return "utf-8" if e.start >= len(head) - 3 else "gbk"
+
+def csv_values(col):
+    """
+    CSV 文本列 → 对象数组：整数与普通小数（12.30、45.00 也算）转为数值；转成数值后含义会变的保留原文，
+    如前导零的编码（010、07551234）、超长数字串、inf / nan，缺失值为 None
+    """
+    import pandas as pd
+    present = col.notna().to_numpy()
+    vals = col.to_numpy(dtype=object)
+    vals[~present] = None
+    text = col.where(col.notna(), "")
+    is_int = text.str.fullmatch(CSV_INT_TEXT).to_numpy(dtype=bool)
+    if is_int.any():
+        vals[is_int] = [int(t) for t in text[is_int]]
+    digits = text.str.replace(r"[-.]", "", regex=True).str.lstrip("0").str.len()
+    is_dec = (text.str.fullmatch(CSV_DEC_TEXT) & (digits <= CSV_DEC_DIGITS)).to_numpy(dtype=bool)
+    if is_dec.any():
+        vals[is_dec] = [float(t) for t in text[is_dec]]
+    cand = present & ~is_int & ~is_dec
+    if cand.any():
+        num = pd.to_numeric(text[cand], errors="coerce")
+        ok = num.notna().to_numpy()
+        for k, v, t in zip(np.flatnonzero(cand)[ok], num[ok].tolist(), text[cand][ok].tolist()):
+            if math.isfinite(v) and repr(v) == t:
+                vals[k] = v
+    return vals
+
+def csv_numeric(col, dtype=None):
+    """
+    CSV 文本列整列都能按 csv_values 还原为数值时，返回数值 Series（全为整数时 Int64，否则 float64）；
+    dtype 给定时按该类型转换。有值还原不了（或放不进 dtype）时返回 None，全空列也返回 None
+    """
+    import pandas as pd
+    vals = csv_values(col)
+    nums = vals[col.notna().to_numpy()]
+    if not len(nums) or not all(isinstance(v, (int, float)) for v in nums):
+        return None
+    all_int = all(isinstance(v, int) for v in nums)
+    dtype = dtype or ("Int64" if all_int else "float64")
+    if dtype == "Int64" and not all_int:
+        return None
+    if dtype == "float64" and any(isinstance(v, int) and abs(v) > 1 << 53 for v in nums):
+        return None  # 超出 float64 精确范围的整数
+    return pd.Series(vals, index=col.index, dtype=dtype)
+
+def iter_table_frames(path, columns=None, chunk_size=FRAME_CHUNK):
+    """
+    按块读取 CSV（read_csv chunksize）或 Parquet（按 batch 读取行组），产出 DataFrame。
+    columns 不为 None 时只读取这些列，列顺序与 columns 一致。
+    CSV 一律按文本读取（只有空单元格算缺失），避免 010、07551234 之类的编码被推断成数字而丢失前导零；
+    数值列由调用方自行转换（X/Y 走 to_numeric，属性见 csv_values）
+    """
+    import pandas as pd
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    reader = pd.read_csv(path, usecols=columns, chunksize=chunk_size, encoding=csv_encoding(path),
+                         dtype=str, keep_default_na=False, na_values=[""])
+    with reader:
+        for frame in reader:
+            yield frame[columns] if columns is not None else frame
+
+def iter_table_rows(path, columns=None, chunk_size=FRAME_CHUNK):
+    """CSV / Parquet 按行产出（第一行为表头），值为 Python 原生类型，缺失值为 None"""
+    header_done = False
+    is_csv = not path.lower().endswith(".parquet")
+    for frame in iter_table_frames(path, columns, chunk_size):
+        if not header_done:
+            yield tuple(str(c) for c in frame.columns)
+            header_done = True
+        if is_csv:
+            yield from zip(*(csv_values(frame[c]) for c in frame.columns))
+            continue
+        frame = frame.astype(object).where(frame.notna(), None)
+        yield from frame.itertuples(index=False, name=None)
+    if not header_done:
+        yield tuple(columns or table_columns(path))
+
+def table_columns(path):
+    """CSV / Parquet 的列名（不读取数据）"""
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(path).schema_arrow.names)
+    import pandas as pd
+    return [str(c) for c in pd.read_csv(path, nrows=0, encoding=csv_encoding(path)).columns]
+
+def table_row_count(path):
+    """Parquet 从元数据取行数；CSV 未知，返回 None"""
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    return None
+
+def sheet_row_count(path, sheet=None):
+    """数据行数（不含表头）的估计，用于进度与剩余时间；取自缓存的会话（见 WorkbookSession.row_count）"""
+    return get_session(path).row_count(sheet)
+
+def open_rows(path, sheet=None, columns=None):
+    """
+    统一的行读取入口（第一行为表头）：xlsx 走 openpyxl 只读流，xls 走 pandas，
+    CSV / Parquet 按块读取且只加载 columns 指定的列（xlsx 无法按列跳过，读取后再筛选）
+    """
+    if is_table_file(path):
+        return iter_table_rows(path, columns)
+    rows = _iter_xls_rows(path, sheet) if path.lower().endswith(".xls") else iter_sheet_rows(path, sheet)
+    return rows if columns is None else _select_columns(rows, columns)
+
+def _select_columns(rows, columns):
+    try:
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [str(c) if c is not None else "" for c in header]
+        idx = [names.index(c) for c in columns]
+        yield tuple(columns)
+        for r in rows:
+            yield tuple(r[i] if i < len(r) else None for i in idx)
+    finally:
+        rows.close()
+
+class WorkbookSession:
+    """
+    单个工作簿的缓存会话：sheet 名、各 sheet 的表头、预览行与行数在切换 sheet 与最终运行之间共享。
+    xlsx 句柄只在读取 sheet 名与预览时临时打开，用完即关：工具开着时不占住文件，
+    Windows 上 Excel 仍可保存同一工作簿（改完重跑正是按 mtime / 大小失效的场景）。预览只读取前 max_rows 行。
+    CSV / Parquet 视为只有一个 sheet（名为文件名）的工作簿。
+    文件 mtime 或大小变化后，get_session() 会丢弃旧会话重新打开
+    """
+    def __init__(self, path):
+        self.path = path
+        self.stamp = file_stamp(path)
+        self.is_xls = path.lower().endswith(".xls")
+        self.is_table = is_table_file(path)
+        self._lock = threading.Lock()
+        self._previews = {}
+        self._row_counts = {}
+        if self.is_table:
+            self.sheet_names = [os.path.basename(path)]
+        elif self.is_xls:
+            import pandas as pd
+            with pd.ExcelFile(path) as xls:
+                self.sheet_names = list(xls.sheet_names)
+        else:
+            wb = self._open()
+            try:
+                self.sheet_names = list(wb.sheetnames)
+            finally:
+                wb.close()
+
+    def _open(self):
+        return openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+
+    def _count_rows(self, ws):
+        n = ws.max_row  # 取自 dimension 记录，不扫描整表
+        return n - 1 if n else None
+
+    def preview(self, sheet, max_rows=200):
+        """返回 (表头, 前 max_rows 行数据)；行已对齐到表头宽度，结果按 sheet 缓存"""
+        with self._lock:
+            hit = self._previews.get(sheet)
+            if hit is None or hit[2] < max_rows:
+                if self.is_table:
+                    it = iter_table_rows(self.path, chunk_size=max_rows + 1)
+                    rows = list(islice(it, max_rows + 1))
+                    it.close()
+                elif self.is_xls:
+                    rows = list(_iter_xls_rows(self.path, sheet, nrows=max_rows + 1))
+                else:
+                    wb = self._open()
+                    try:
+                        ws = wb[sheet]
+                        rows = list(ws.iter_rows(max_row=max_rows + 1, values_only=True))
+                        self._row_counts[sheet] = self._count_rows(ws)
+                    finally:
+                        wb.close()
+                if not rows:
+                    raise ValueError("Sheet 为空")
+                headers = [str(c) if c is not None else "" for c in rows[0]]
+                data = [fit_row(r, len(headers)) for r in rows[1:]]
+                hit = self._previews[sheet] = (headers, data, max_rows)
+        return hit[0], hit[1][:max_rows]
+
+    def headers(self, sheet):
+        return self.preview(sheet)[0]
+
+    def row_count(self, sheet):
+        """数据行数（不含表头）的估计：xlsx 取自 dimension 记录（预览时已记下），Parquet 取自元数据，未知时返回 None"""
+        if self.is_table:
+            return table_row_count(self.path)
+        if self.is_xls:
+            return None
+        with self._lock:
+            if sheet not in self._row_counts:
+                wb = self._open()
+                try:
+                    self._row_counts[sheet] = self._count_rows(wb[sheet])
+                finally:
+                    wb.close()
+            return self._row_counts[sheet]
+
+    def iter_rows(self, sheet, columns=None):
+        """完整读取 Sheet（含表头行）；使用独立句柄，可在工作线程中与预览并行"""
+        return open_rows(self.path, sheet, columns)
+
+    def close(self):
+        """句柄用完即关，这里只丢弃缓存"""
+        self._previews.clear()
+        self._row_counts.clear()
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def get_session(path):
+    """按路径取缓存的会话；文件已修改则重新打开"""
+    key = os.path.abspath(path)
+    with _sessions_lock:
+        s = _sessions.get(key)
+        if s is not None and s.stamp != file_stamp(path):
+            s.close()
+            s = None
+        if s is None:
+            s = _sessions[key] = WorkbookSession(path)
+        _sessions.move_to_end(key)
+        while len(_sessions) > MAX_SESSIONS:
+            _, old = _sessions.popitem(last=False)
+            old.close()
+    return s